@@ -9,9 +9,12 @@ import sqlite3
 import json
 import time
 import os
+import html
 from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
+from cache_backend import create_cache
+import chat_stats
 
 # Configuración del modelo
 MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
@@ -30,12 +33,19 @@ api_key = os.getenv("OPENAI_API_KEY", "your_openai_api_key_here")
 # Initialize client even if key is invalid (will handle errors later)
 client = OpenAI(api_key=api_key)
 
-# Cache for storing conversation histories
-conversation_cache = {}
+# Cache for storing conversation histories, shared between workers when
+# CONVERSATION_CACHE_BACKEND is 'sqlite' or 'redis'
+conversation_cache = create_cache(
+    os.getenv("CONVERSATION_CACHE_BACKEND", os.getenv("CACHE_BACKEND")),
+    os.getenv("CONVERSATION_CACHE_URL", os.getenv("CACHE_URL"))
+)
 
 # Set expiration time for cache entries (3 hours)
 CACHE_EXPIRY_SECONDS = 10800
 
+# Ruta de la base de datos de conversaciones
+CONVERSATION_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.db')
+
 def load_model():
     """Carga el modelo y el tokenizador"""
     global model, tokenizer
@@ -54,8 +64,7 @@ def load_model():
 
 def create_conversation_db():
     """Crea una base de datos SQLite para almacenar el historial de conversaciones"""
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.db')
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(CONVERSATION_DB_PATH)
     cursor = conn.cursor()
     
     # Crear tabla de conversaciones si no existe
@@ -73,8 +82,46 @@ def create_conversation_db():
     # Crear índice para búsquedas más rápidas
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_id ON conversations (session_id)')
     
+    # Índice FTS5 de los mensajes, sincronizado con la tabla mediante triggers
+    fts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='conversations_fts'"
+    ).fetchone() is not None
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        message,
+        content='conversations',
+        content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, message) VALUES (new.rowid, new.message);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, message) VALUES ('delete', old.rowid, old.message);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, message) VALUES ('delete', old.rowid, old.message);
+        INSERT INTO conversations_fts(rowid, message) VALUES (new.rowid, new.message);
+    END
+    ''')
+    if not fts_exists:
+        # Indexar los mensajes guardados antes de crear el índice
+        cursor.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+    
+    # Tablas de estadísticas agregadas para el panel de administración
+    rollups_created = chat_stats.create_rollup_tables(conn)
+    
     conn.commit()
     conn.close()
+    
+    if rollups_created:
+        chat_stats.rebuild_rollups(CONVERSATION_DB_PATH)
 
 def save_message(session_id, user_id, message, role):
     """Guarda un mensaje en la base de datos
@@ -86,8 +133,7 @@ def save_message(session_id, user_id, message, role):
         role (str): 'user' o 'assistant'
     """
     try:
-        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.db')
-        conn = sqlite3.connect(db_path)
+        conn = sqlite3.connect(CONVERSATION_DB_PATH)
         cursor = conn.cursor()
         
         timestamp = datetime.now().isoformat()
@@ -98,9 +144,23 @@ def save_message(session_id, user_id, message, role):
         
         conn.commit()
         conn.close()
+        
+        # Actualizar las estadísticas en segundo plano
+        chat_stats.record_message(CONVERSATION_DB_PATH, session_id, role, timestamp)
     except Exception as e:
         print(f"Error al guardar mensaje: {str(e)}")
 
+def record_failed_response(session_id):
+    """Cuenta en las estadísticas una pregunta que la IA no pudo responder
+    
+    Args:
+        session_id (str): ID de la sesión de conversación
+    """
+    try:
+        chat_stats.record_message(CONVERSATION_DB_PATH, session_id, None, datetime.now().isoformat())
+    except Exception as e:
+        print(f"Error al registrar el fallo: {str(e)}")
+
 def get_conversation_history(session_id, limit=10):
     """Obtiene el historial de conversación para una sesión
     
@@ -112,8 +172,7 @@ def get_conversation_history(session_id, limit=10):
         list: Lista de mensajes con sus roles
     """
     try:
-        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.db')
-        conn = sqlite3.connect(db_path)
+        conn = sqlite3.connect(CONVERSATION_DB_PATH)
         cursor = conn.cursor()
         
         cursor.execute(
@@ -129,6 +188,61 @@ def get_conversation_history(session_id, limit=10):
         print(f"Error al obtener historial: {str(e)}")
         return []
 
+def _fts_query(query):
+    """Convierte el texto del usuario en una consulta FTS5 segura (todas las palabras, con prefijo)"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_conversations(query, role=None, limit=20, offset=0):
+    """Busca mensajes en el historial usando el índice FTS5
+    
+    Args:
+        query (str): Texto a buscar
+        role (str): 'user' o 'assistant' para filtrar por autor (opcional)
+        limit (int): Número máximo de resultados
+        offset (int): Resultados a saltar (paginación)
+        
+    Returns:
+        tuple: (total de coincidencias, lista de resultados ordenados por relevancia BM25)
+    """
+    match = _fts_query(query)
+    if not match:
+        return 0, []
+    
+    role_filter = ' AND c.role = ?' if role else ''
+    params = [match] + ([role] if role else [])
+    
+    conn = sqlite3.connect(CONVERSATION_DB_PATH)
+    try:
+        total = conn.execute(
+            'SELECT COUNT(*) FROM conversations_fts JOIN conversations c ON c.rowid = conversations_fts.rowid '
+            'WHERE conversations_fts MATCH ?' + role_filter,
+            params
+        ).fetchone()[0]
+        rows = conn.execute(
+            "SELECT c.session_id, c.user_id, c.timestamp, c.role, "
+            "snippet(conversations_fts, 0, char(2), char(3), '…', 16), bm25(conversations_fts) AS rank "
+            'FROM conversations_fts JOIN conversations c ON c.rowid = conversations_fts.rowid '
+            'WHERE conversations_fts MATCH ?' + role_filter + ' ORDER BY rank LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    results = []
+    for session_id, user_id, timestamp, msg_role, snippet, rank in rows:
+        # Escapar el mensaje del usuario y resaltar solo las coincidencias
+        snippet = html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+        results.append({
+            'session_id': session_id,
+            'user_id': user_id,
+            'timestamp': timestamp,
+            'role': msg_role,
+            'snippet': snippet,
+            'rank': rank
+        })
+    return total, results
+
 def format_prompt(user_message, conversation_history=None):
     """Format the message and conversation history for the AI model
 
@@ -202,16 +316,10 @@ def get_ai_response(user_message, conversation_history=None, session_id=None):
         return "يرجى كتابة سؤال أو طلب للمدرب الافتراضي."
     
     try:
-        # Handle session conversation history
-        if session_id and session_id in conversation_cache:
-            # Get cached conversation if within expiry time
-            cache_entry = conversation_cache[session_id]
-            now = datetime.now().timestamp()
-            if now - cache_entry["timestamp"] < CACHE_EXPIRY_SECONDS:
-                conversation_history = cache_entry["conversation"]
-            else:
-                # Expired cache, start new conversation
-                conversation_history = []
+        # Handle session conversation history (expired entries are not returned)
+        cached_conversation = conversation_cache.get(f"conversation:{session_id}") if session_id else None
+        if cached_conversation is not None:
+            conversation_history = cached_conversation
         elif not conversation_history:
             conversation_history = []
         
@@ -243,10 +351,11 @@ def get_ai_response(user_message, conversation_history=None, session_id=None):
                 conversation_history = conversation_history[-10:]
                 
             # Update or create cache entry
-            conversation_cache[session_id] = {
-                "conversation": conversation_history,
-                "timestamp": datetime.now().timestamp()
-            }
+            conversation_cache.set(
+                f"conversation:{session_id}",
+                conversation_history,
+                ttl=CACHE_EXPIRY_SECONDS
+            )
             
             # Clean up expired cache entries
             clean_expired_cache()
@@ -284,12 +393,4 @@ def enhance_chatbot_response(response):
 
 def clean_expired_cache():
     """Clean up expired entries from conversation cache"""
-    now = datetime.now().timestamp()
-    expired_keys = []
-    
-    for key, value in conversation_cache.items():
-        if now - value["timestamp"] > CACHE_EXPIRY_SECONDS:
-            expired_keys.append(key)
-            
-    for key in expired_keys:
-        del conversation_cache[key]
+    conversation_cache.purge_expired()
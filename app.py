@@ -1,6 +1,7 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, abort
 from functools import wraps
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 import os
 from datetime import datetime
 from datetime import timedelta
@@ -12,15 +13,37 @@ import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+import mimetypes
 import hashlib
 import base64
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import click
+import search_index
+from cache_backend import create_cache
+from page_cache import PageCache
+from http_cache import ChangeStamps
+from related_items import RelatedItems
+from content_io import create_content_cli
+from change_tracking import ChangeTrackingMixin, hide_deleted, mark_deleted
+from db_config import database_url, engine_options, configure_engine
+from query_stats import QueryStats
+from fast_json import json_response, rows_to_dicts
+from chunked_upload import ChunkedUploads, UploadError
+from image_variants import generate_variants, variant_paths, picture_tag
+from media_jobs import MediaJobs
+import media_reconcile
+from static_assets import StaticAssets
+from semantic_index import SemanticIndex
+from dotenv import load_dotenv
+from sqlalchemy import tuple_, bindparam
+
+load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(16)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gym.db'
+# Base de datos y opciones del pool desde el entorno (ver db_config.py)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Configuraciones de seguridad adicionales
@@ -30,6 +53,36 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)  # Sesión dura 1 día
 
 db = SQLAlchemy(app)
+with app.app_context():
+    configure_engine(db.engine)
+    # Número y tiempo de consultas por petición, con aviso de posibles N+1 (ver query_stats.py)
+    if os.getenv('QUERY_STATS') == '1' or os.getenv('FLASK_DEBUG') == '1':
+        query_stats = QueryStats(app, db.engine)
+migrate = Migrate(app, db, render_as_batch=True)
+
+# Caché compartida de la aplicación (CACHE_BACKEND / CACHE_URL en el entorno)
+app_cache = create_cache()
+
+def deploy_build():
+    """Build id and time of the deployed templates and static asset manifest"""
+    paths = [os.path.join(app.static_folder, 'assets-manifest.json')]
+    for directory, _, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        paths.extend(os.path.join(directory, name) for name in files)
+    digest = hashlib.sha256()
+    built_at = None
+    for path in sorted(paths):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(os.path.relpath(path, app.root_path).encode() + b'\0' + f.read())
+            mtime = datetime.utcfromtimestamp(os.path.getmtime(path))
+        except FileNotFoundError:
+            continue
+        if built_at is None or mtime > built_at:
+            built_at = mtime
+    return digest.hexdigest()[:12], built_at
+
+# Las cachés de páginas y los ETag dependen también de las plantillas y los assets desplegados
+BUILD_ID, BUILT_AT = deploy_build()
 
 # Configuración de contraseña segura
 ADMIN_USERNAME = 'admin'
@@ -57,8 +110,13 @@ def load_model():
     load_ai_model()
 
 # Models
-class Exercise(db.Model):
+class Exercise(ChangeTrackingMixin, db.Model):
     __tablename__ = 'exercises'
+    __table_args__ = (
+        db.Index('ix_exercises_category_created_at', 'category', 'created_at'),
+        db.Index('ix_exercises_created_at', 'created_at'),
+        db.Index('ix_exercises_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # beginners, muscle_gain, fat_loss, home
@@ -67,8 +125,13 @@ class Exercise(db.Model):
     image_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-class Nutrition(db.Model):
+class Nutrition(ChangeTrackingMixin, db.Model):
     __tablename__ = 'nutrition'
+    __table_args__ = (
+        db.Index('ix_nutrition_category_created_at', 'category', 'created_at'),
+        db.Index('ix_nutrition_created_at', 'created_at'),
+        db.Index('ix_nutrition_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # meals, beginners_diet, weight_loss, pre_post_workout
@@ -77,8 +140,11 @@ class Nutrition(db.Model):
     image_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-class Supplement(db.Model):
+class Supplement(ChangeTrackingMixin, db.Model):
     __tablename__ = 'supplements'
+    __table_args__ = (
+        db.Index('ix_supplements_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))
@@ -87,8 +153,13 @@ class Supplement(db.Model):
     recommended_dosage = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-class TrainingProgram(db.Model):
+class TrainingProgram(ChangeTrackingMixin, db.Model):
     __tablename__ = 'training_programs'
+    __table_args__ = (
+        db.Index('ix_training_programs_category_created_at', 'category', 'created_at'),
+        db.Index('ix_training_programs_created_at', 'created_at'),
+        db.Index('ix_training_programs_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # beginner_3day, bulk, cutting, home
@@ -96,8 +167,13 @@ class TrainingProgram(db.Model):
     schedule = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-class Article(db.Model):
+class Article(ChangeTrackingMixin, db.Model):
     __tablename__ = 'articles'
+    __table_args__ = (
+        db.Index('ix_articles_category_created_at', 'category', 'created_at'),
+        db.Index('ix_articles_created_at', 'created_at'),
+        db.Index('ix_articles_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # common_mistakes, habits, motivation
@@ -109,6 +185,11 @@ class Article(db.Model):
 # New Media model for storing uploaded files
 class Media(db.Model):
     __tablename__ = 'media'
+    __table_args__ = (
+        db.Index('ix_media_category_created_at', 'category', 'created_at'),
+        db.Index('ix_media_filetype_created_at', 'filetype', 'created_at'),
+        db.Index('ix_media_created_at', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     filename = db.Column(db.String(255), nullable=False, unique=True)
@@ -118,69 +199,534 @@ class Media(db.Model):
     category = db.Column(db.String(50)) # exercises, nutrition, articles, etc.
     alt_text = db.Column(db.String(255))
     description = db.Column(db.Text)
+    sha256 = db.Column(db.String(64), index=True)  # content hash, identical uploads share one row
+    variants = db.Column(db.JSON)  # resized WebP/JPEG copies, see image_variants.py
+    width = db.Column(db.Integer)   # images only
+    height = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')  # pending, ready, failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Contador de cambios por tabla, usado para ETag / Last-Modified
+class ChangeStamp(db.Model):
+    __tablename__ = 'change_stamps'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime)
+
+# Elementos relacionados precalculados para las páginas de detalle
+class RelatedItem(db.Model):
+    __tablename__ = 'related_items'
+    __table_args__ = (
+        db.Index('ix_related_items_kind_related_id', 'kind', 'related_id'),
+    )
+    kind = db.Column(db.String(50), primary_key=True)   # table name of the content
+    item_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float)
+
 # Alias para compatibilidad con init_db.py
 Workout = Exercise
 
+# Los contenidos borrados quedan como "tombstones" (deleted_at) para /api/changes
+hide_deleted(Exercise, Nutrition, Supplement, TrainingProgram, Article)
+
+change_stamps = ChangeStamps(db, ChangeStamp, [
+    Exercise.__tablename__, Nutrition.__tablename__, Supplement.__tablename__,
+    TrainingProgram.__tablename__, Article.__tablename__, Media.__tablename__
+], build_id=BUILD_ID, built_at=BUILT_AT)
+
+# Caché de páginas públicas para visitantes anónimos. Cada página guardada se
+# compara además con los change_stamps de sus tablas, así que una edición la
+# invalida en todos los workers aunque la caché sea local a cada proceso.
+page_cache = PageCache(app_cache, build_id=BUILD_ID, stamps=lambda tables: change_stamps.get(tables)[0])
+
+related_items = RelatedItems(app, db, RelatedItem, {
+    Exercise.__tablename__: (Exercise, 'name', 'description'),
+    Nutrition.__tablename__: (Nutrition, 'title', 'description'),
+    TrainingProgram.__tablename__: (TrainingProgram, 'name', 'description'),
+    Article.__tablename__: (Article, 'title', 'content'),
+}, workers=int(os.getenv('RELATED_ITEMS_WORKERS', '1')),
+   # related_changed is defined with the other invalidation helpers below
+   on_change=lambda model, item_ids: related_changed(model, item_ids))
+
+# Políticas de Cache-Control: las páginas siempre se revalidan (respuesta 304 barata),
+# las APIs públicas pueden reutilizarse unos segundos
+PAGE_CACHE_CONTROL = 'public, no-cache'
+API_CACHE_CONTROL = 'public, max-age=30, must-revalidate'
+
+# Consultas frecuentes de las páginas públicas. Están escritas para usar los
+# índices (category, created_at) y created_at; check_query_plans.py verifica sus planes.
+def category_query(model, category):
+    """Items of one category, newest first"""
+    return model.query.filter_by(category=category).order_by(model.created_at.desc())
+
+def latest_query(model):
+    """All items, newest first"""
+    return model.query.order_by(model.created_at.desc())
+
+def related_query(model, item, limit=3):
+    """Other items from the same category as item"""
+    return category_query(model, item.category).filter(model.id != item.id).limit(limit)
+
+def get_related(model, item):
+    """Precomputed neighbours of item, or the newest items of its category if they were never computed"""
+    related = related_items.neighbours(model, item.id)
+    return related if related is not None else related_query(model, item).all()
+
+def keyset_query(model, category=None, after=None):
+    """Newest-first listing that resumes after the (created_at, id) pair of the last row seen"""
+    query = category_query(model, category) if category else latest_query(model)
+    query = query.order_by(None).order_by(model.created_at.desc(), model.id.desc())
+    if after:
+        query = query.filter(tuple_(model.created_at, model.id) < after)
+    return query
+
+# Índice de búsqueda de texto completo (FTS5), sincronizado por eventos de SQLAlchemy
+search_index.register(Exercise, 'exercise', 'name', 'description', code=1)
+search_index.register(Nutrition, 'nutrition', 'title', 'description', code=2)
+search_index.register(Article, 'article', 'title', 'content', code=3)
+search_index.register(Media, 'media', 'title', 'description', code=4)
+
 # Create the database tables
 def init_db():
     with app.app_context():
         db.create_all()
+        search_index.ensure_search_index(db.session.connection())
+        db.session.commit()
+        # Historial del chatbot (conversations.db), índice FTS y tablas de estadísticas
+        from ai_helper import create_conversation_db
+        create_conversation_db()
+
+@app.cli.command('rebuild-related')
+def rebuild_related_command():
+    """Recompute the related_items table for every content type."""
+    related_items.rebuild()
+    print('Related items rebuilt')
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """Rebuild the full-text search index from the content tables."""
+    search_index.rebuild_search_index(db.session.connection())
+    db.session.commit()
+    print('Search index rebuilt')
 
 # Configure upload directories
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
 IMAGE_UPLOADS = os.path.join(UPLOAD_FOLDER, 'images')
+VARIANT_UPLOADS = os.path.join(IMAGE_UPLOADS, 'variants')
 VIDEO_UPLOADS = os.path.join(UPLOAD_FOLDER, 'videos')
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'webm', 'mov', 'avi'}
 
 # Create upload directories if they don't exist
-for directory in [UPLOAD_FOLDER, IMAGE_UPLOADS, VIDEO_UPLOADS]:
+for directory in [UPLOAD_FOLDER, IMAGE_UPLOADS, VIDEO_UPLOADS, VARIANT_UPLOADS]:
     os.makedirs(directory, exist_ok=True)
 
+# Archivos subidos: peticiones Range (206) para avanzar en los vídeos, envío sin copia
+# y caché inmutable (cada nombre de archivo es único, nunca se reescribe).
+# USE_X_SENDFILE=1 delega el envío en Apache/lighttpd; UPLOADS_ACCEL_REDIRECT (p. ej.
+# /protected-uploads/) en una location interna de nginx. Sin ninguno de los dos, el
+# servidor WSGI recibe el archivo abierto (wsgi.file_wrapper, sendfile en gunicorn).
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1'
+UPLOADS_ACCEL_REDIRECT = os.getenv('UPLOADS_ACCEL_REDIRECT')
+
+@app.route('/static/uploads/<any(images, videos):kind>/<path:filename>')
+def uploaded_file(kind, filename):
+    directory = IMAGE_UPLOADS if kind == 'images' else VIDEO_UPLOADS
+    if UPLOADS_ACCEL_REDIRECT:
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{UPLOADS_ACCEL_REDIRECT.rstrip('/')}/{kind}/{filename}"
+    else:
+        response = send_from_directory(directory, filename, conditional=True, max_age=UPLOAD_CACHE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+# CSS, JS e imágenes con huella de contenido (ver static_assets.py). `flask build-assets`
+# en cada despliegue; url_for('static', ...) emite entonces los nombres con huella.
+static_assets = StaticAssets(app)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, gzip-precompressed copies of the static assets."""
+    print(f'{static_assets.build()} static assets built')
+
 # Helper function to check allowed file extensions
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def upload_shard(filename):
+    """'ab/cd' subdirectory of an upload, taken from its hex name (or from a hash of other names).
+
+    Spreads the library over 65536 folders so none of them grows to a size
+    that makes listing, backups and lookups slow.
+    """
+    stem = filename.rsplit('.', 1)[0].lower()
+    if len(stem) < 4 or any(c not in '0123456789abcdef' for c in stem):
+        stem = hashlib.sha256(filename.encode('utf-8')).hexdigest()
+    return f'{stem[:2]}/{stem[2:4]}'
+
+def media_destination(original_filename):
+    """(filetype, unique filename, absolute path, public URL) for a media upload, or None if the type is not allowed"""
+    file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+    unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
+    relative = f'{upload_shard(unique_filename)}/{unique_filename}'
+    if allowed_file(original_filename, ALLOWED_IMAGE_EXTENSIONS):
+        return 'image', unique_filename, os.path.join(IMAGE_UPLOADS, relative), f'/static/uploads/images/{relative}'
+    if allowed_file(original_filename, ALLOWED_VIDEO_EXTENSIONS):
+        return 'video', unique_filename, os.path.join(VIDEO_UPLOADS, relative), f'/static/uploads/videos/{relative}'
+    return None
+
+def media_title(original_filename):
+    return original_filename.rsplit('.', 1)[0].replace('-', ' ').replace('_', ' ').title()
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def media_path(media):
+    """Filesystem path of a media file"""
+    return os.path.join(app.static_folder, media.filepath.replace('/static/', '', 1))
+
+def media_variant_location(media):
+    """(directory, public URL) for the variants of an image"""
+    shard = upload_shard(media.filename)
+    return os.path.join(VARIANT_UPLOADS, shard), f'/static/uploads/images/variants/{shard}'
+
+def generate_media_variants(media):
+    """Create the responsive variants of an image (no-op for other files)"""
+    if media.filetype != 'image':
+        return
+    media.variants = generate_variants(media_path(media), *media_variant_location(media))
+    app_cache.delete(f'variants:{media.filepath}')
+
+def remove_media_files(media):
+    """Delete a media file and its variants from disk"""
+    for path in [media_path(media)] + variant_paths(media.variants, app.static_folder):
+        try:
+            os.remove(path)
+        except (FileNotFoundError, OSError):
+            pass
+
+def store_media(file, category, title=None, filetype=None):
+    """Save an uploaded file to the media library, reusing an identical file already stored.
+
+    The upload is streamed to a temporary file while its SHA-256 is computed.
+    If a Media row has the same hash that row is returned and nothing new is
+    written; otherwise the file is moved into place and a new 'pending' Media
+    row is added to the session, with its processing job queued for when the
+    caller commits.
+
+    Returns None if the file type is not allowed, or is not filetype when given.
+    """
+    original_filename = secure_filename(file.filename)
+    destination = media_destination(original_filename)
+    if destination is None or (filetype and destination[0] != filetype):
+        return None
+    filetype, unique_filename, filepath, relative_path = destination
+
+    sha = hashlib.sha256()
+    filesize = 0
+    temp_path = filepath + '.upload'
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    try:
+        with open(temp_path, 'wb') as out:
+            for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+                sha.update(block)
+                out.write(block)
+                filesize += len(block)
+        digest = sha.hexdigest()
+        existing = Media.query.filter_by(sha256=digest).first()
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    if existing is not None:
+        os.remove(temp_path)
+        return existing
+
+    os.replace(temp_path, filepath)
+    media = Media(
+        title=title or media_title(original_filename),
+        filename=unique_filename,
+        filepath=relative_path,
+        filetype=filetype,
+        filesize=filesize,
+        category=category,
+        sha256=digest,
+        status='pending'
+    )
+    db.session.add(media)
+    db.session.flush()
+    enqueue_media_job(media)
+    return media
+
+# Procesamiento de medios en segundo plano (ver media_jobs.py)
+def media_job(media):
+    variant_dir, variant_url = media_variant_location(media)
+    return {
+        'path': media_path(media),
+        'filetype': media.filetype,
+        'sha256': media.sha256,
+        'variant_dir': variant_dir,
+        'variant_url': variant_url
+    }
+
+def enqueue_media_job(media):
+    """Queue hashing, metadata and variants for a flushed Media row"""
+    media_jobs.enqueue(media.id, media_job(media))
+
+def apply_media_result(media_id, result, error):
+    """Store the outcome of a media job on its row"""
+    media = db.session.get(Media, media_id)
+    if media is None:
+        return
+    if error is not None:
+        app.logger.error('Media job for %s failed: %s', media_id, error)
+        media.status = 'failed'
+        db.session.commit()
+        return
+
+    duplicate = Media.query.filter(Media.sha256 == result['sha256'], Media.id != media.id).first()
+    if duplicate is not None and media.sha256 is None:
+        # Chunked uploads are hashed here; an identical file is already in the library
+        media.variants = result['variants']
+        remove_media_files(media)
+        db.session.delete(media)
+        db.session.commit()
+        return
+
+    media.sha256 = result['sha256']
+    media.filesize = result['filesize']
+    media.width, media.height = result['width'], result['height']
+    media.variants = result['variants']
+    media.status = 'ready'
+    db.session.commit()
+    app_cache.delete(f'variants:{media.filepath}')
+
+media_jobs = MediaJobs(app, db, apply_media_result,
+                       workers=int(os.environ['MEDIA_WORKERS']) if os.getenv('MEDIA_WORKERS') else None)
+
+@app.cli.command('process-media')
+@click.option('--all', 'everything', is_flag=True, help='Reprocess every file, not only pending and failed ones.')
+def process_media_command(everything):
+    """Run the processing jobs of pending or failed media (e.g. after a restart)."""
+    query = Media.query if everything else Media.query.filter(Media.status.in_(['pending', 'failed']))
+    ids = [media.id for media in query.all()]
+    for media_id in ids:
+        media_jobs.run(media_id, media_job(db.session.get(Media, media_id)))
+    print(f'{len(ids)} media files processed')
+
+# Subidas por partes reanudables para vídeos grandes (ver chunked_upload.py)
+chunked_uploads = ChunkedUploads(os.path.join(app.instance_path, 'uploads'))
+
+@app.cli.command('purge-uploads')
+def purge_uploads_command():
+    """Remove chunked uploads with no activity for a day."""
+    print(f'{chunked_uploads.purge_stale()} stale uploads removed')
+
+def content_changed(model, item_id, *categories):
+    """Refresh derived data after an item is created, edited or deleted.
+
+    Queues the recompute of its related items and drops the cached pages and
+    counts that show it. Call after committing, passing the item's category
+    before and after the change.
+    """
+    related_items.schedule(related_items.update, model, item_id)
+    table = model.__tablename__
+    categories = {c for c in categories if c}
+    page_cache.invalidate(table, f'{table}:{item_id}', *[f'{table}:{c}' for c in categories])
+    for category in categories | {'all'}:
+        app_cache.delete(f"count:{table}:{category}")
+
+def table_pages_changed(model):
+    """Drop every cached page of a content table and its listings"""
+    table = model.__tablename__
+    # Detail pages are also tagged with their category, so category tags cover them
+    categories = {c for c in db.session.execute(db.select(model.category).distinct()).scalars() if c}
+    page_cache.invalidate(table, *[f'{table}:{c}' for c in categories])
+    return categories
+
+def related_changed(model, item_ids):
+    """Stamp and drop the detail pages whose related items were recomputed (None: all of them)"""
+    table = model.__tablename__
+    with db.engine.begin() as connection:
+        change_stamps.touch(connection, table)
+    if item_ids is None:
+        table_pages_changed(model)
+    else:
+        page_cache.invalidate(*[f'{table}:{item_id}' for item_id in item_ids])
+
+def content_imported(model):
+    """Refresh derived data after a bulk import, which bypasses the ORM events.
+
+    The search index of the model is rebuilt set-based in the same call; related
+    items and embeddings are recomputed afterwards on their background threads.
+    """
+    table = model.__tablename__
+    with db.engine.begin() as connection:
+        change_stamps.touch(connection, table)
+        search_index.rebuild_search_index(connection, [model])
+    if table in related_items.sources:
+        related_items.schedule(related_items.rebuild, model)
+    if table in semantic_index.sources:
+        semantic_index.schedule(semantic_index.backfill, table)
+    categories = table_pages_changed(model)
+    for category in categories | {'all'}:
+        app_cache.delete(f"count:{table}:{category}")
+
+app.cli.add_command(create_content_cli(db, [
+    Exercise, Nutrition, Supplement, TrainingProgram, Article, Media
+], after_import=content_imported))
+
 # API endpoints para acceso por AJAX
-@app.route('/api/exercises')
-def api_exercises():
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+API_COUNT_TTL = 60
+
+def encode_cursor(created_at, item_id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{item_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    created_at, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(item_id)
+
+def cached_count(model, category):
+    """Number of items in a category ('all' for every item), cached for API_COUNT_TTL seconds"""
+    key = f"count:{model.__tablename__}:{category}"
+    count = app_cache.get(key)
+    if count is None:
+        query = model.query if category == 'all' else model.query.filter_by(category=category)
+        count = query.count()
+        app_cache.set(key, count, ttl=API_COUNT_TTL)
+    return count
+
+def api_list(model, allowed_fields):
+    """Cursor-paginated JSON listing with sparse fieldsets.
+
+    Query parameters: category, fields (comma separated), limit and cursor.
+    The body is a JSON list; X-Total-Count, X-Next-Cursor and a Link header
+    describe the pagination.
+    """
     category = request.args.get('category', 'all')
-    if category == 'all':
-        exercises = Exercise.query.all()
-    else:
-        exercises = Exercise.query.filter_by(category=category).all()
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+
+    fields = allowed_fields
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        if 'id' not in fields:
+            fields = ['id'] + fields
+
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    columns = [getattr(model, f) for f in fields] + [model.created_at]
+    rows = keyset_query(model, None if category == 'all' else category, after) \
+        .with_entities(*columns).limit(limit + 1).all()
+
+    response = json_response(rows_to_dicts(fields, rows[:limit]))
+    response.headers['X-Total-Count'] = str(cached_count(model, category))
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[-1], last[0])
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, _external=True, **args)}>; rel="next"'
+    return response
 
-    result = [{
-        'id': ex.id,
-        'name': ex.name,
-        'category': ex.category,
-        'description': ex.description,
-        'video_url': ex.video_url,
-        'image_url': ex.image_url
-    } for ex in exercises]
+# Campos públicos de cada tipo de contenido en las APIs
+API_FEEDS = {
+    'exercises': (Exercise, ['id', 'name', 'category', 'description', 'video_url', 'image_url']),
+    'nutrition': (Nutrition, ['id', 'title', 'category', 'calories', 'description', 'image_url']),
+    'supplements': (Supplement, ['id', 'name', 'category', 'benefits', 'side_effects', 'recommended_dosage']),
+    'training_programs': (TrainingProgram, ['id', 'name', 'category', 'description', 'schedule']),
+    'articles': (Article, ['id', 'title', 'category', 'content', 'image_url', 'video_url']),
+}
 
-    return jsonify(result)
+@app.route('/api/exercises')
+@change_stamps.conditional('exercises', cache_control=API_CACHE_CONTROL)
+def api_exercises():
+    return api_list(*API_FEEDS['exercises'])
 
 @app.route('/api/nutrition')
+@change_stamps.conditional('nutrition', cache_control=API_CACHE_CONTROL)
 def api_nutrition():
-    category = request.args.get('category', 'all')
-    if category == 'all':
-        items = Nutrition.query.all()
-    else:
-        items = Nutrition.query.filter_by(category=category).all()
-
-    result = [{
-        'id': item.id,
-        'title': item.title,
-        'category': item.category,
-        'calories': item.calories,
-        'description': item.description,
-        'image_url': item.image_url
-    } for item in items]
+    return api_list(*API_FEEDS['nutrition'])
+
+def encode_since(positions):
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(',', ':')).encode()).decode()
+
+def decode_since(since):
+    """{feed: (updated_at, id)} from a /api/changes cursor"""
+    positions = json.loads(base64.urlsafe_b64decode(since.encode()).decode())
+    return {name: (datetime.fromisoformat(position[0]), int(position[1]))
+            for name, position in positions.items() if name in API_FEEDS}
+
+@app.route('/api/changes')
+@change_stamps.conditional(*API_FEEDS, cache_control=API_CACHE_CONTROL)
+def api_changes():
+    """Everything created, edited or deleted since a cursor, for incremental sync.
+
+    Query parameters: since (cursor from a previous response; omit for a full
+    sync), types (comma separated feeds, default all) and limit (rows per
+    feed). Each feed is read in (updated_at, id) order from its own position,
+    so the returned 'next' cursor can be passed back until has_more is false.
+    """
+    types = list(API_FEEDS)
+    if request.args.get('types'):
+        types = [t.strip() for t in request.args['types'].split(',') if t.strip()]
+        unknown = [t for t in types if t not in API_FEEDS]
+        if unknown:
+            return jsonify({'error': f"Unknown types: {', '.join(unknown)}"}), 400
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+
+    since = {}
+    if request.args.get('since'):
+        try:
+            since = decode_since(request.args['since'])
+        except (ValueError, TypeError, IndexError, AttributeError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    changes = {}
+    positions = {name: [updated_at.isoformat(), item_id] for name, (updated_at, item_id) in since.items()}
+    has_more = False
+    for name in types:
+        model, fields = API_FEEDS[name]
+        query = model.query.execution_options(include_deleted=True) \
+            .order_by(model.updated_at, model.id) \
+            .with_entities(*[getattr(model, f) for f in fields], model.updated_at, model.deleted_at)
+        if name in since:
+            query = query.filter(tuple_(model.updated_at, model.id) > since[name])
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+
+        changes[name] = {
+            'updated': [dict(zip(fields, row[:-2]), updated_at=row[-2])
+                        for row in rows if row[-1] is None],
+            'deleted': [row[0] for row in rows if row[-1] is not None]
+        }
+        if rows:
+            positions[name] = [rows[-1][-2].isoformat(), rows[-1][0]]
 
-    return jsonify(result)
+    return json_response({'changes': changes, 'next': encode_since(positions), 'has_more': has_more})
 
 # Admin authentication
 def admin_required(f):
@@ -239,46 +785,20 @@ def admin_article_new():
         # Handle image upload
         if 'image_file' in request.files and request.files['image_file'].filename:
             image_file = request.files['image_file']
-            if allowed_file(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                # Generate unique filename
-                image_filename = f"{uuid.uuid4().hex}.{image_file.filename.rsplit('.', 1)[1].lower()}"
-                image_filepath = os.path.join(IMAGE_UPLOADS, image_filename)
-                image_file.save(image_filepath)
-                image_url = f'/static/uploads/images/{image_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Image for article: {request.form['title']}",
-                    filename=image_filename,
-                    filepath=image_url,
-                    filetype='image',
-                    filesize=os.path.getsize(image_filepath),
-                    category='articles'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(image_file, 'articles', f"Image for article: {request.form['title']}", filetype='image')
+            if media is not None:
+                image_url = media.filepath
         elif request.form.get('image_url'):
             image_url = request.form['image_url']
         
         # Handle video upload
         if 'video_file' in request.files and request.files['video_file'].filename:
             video_file = request.files['video_file']
-            if allowed_file(video_file.filename, ALLOWED_VIDEO_EXTENSIONS):
-                # Generate unique filename
-                video_filename = f"{uuid.uuid4().hex}.{video_file.filename.rsplit('.', 1)[1].lower()}"
-                video_filepath = os.path.join(VIDEO_UPLOADS, video_filename)
-                video_file.save(video_filepath)
-                video_url = f'/static/uploads/videos/{video_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Video for article: {request.form['title']}",
-                    filename=video_filename,
-                    filepath=video_url,
-                    filetype='video',
-                    filesize=os.path.getsize(video_filepath),
-                    category='articles'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(video_file, 'articles', f"Video for article: {request.form['title']}", filetype='video')
+            if media is not None:
+                video_url = media.filepath
         elif request.form.get('video_url'):
             video_url = request.form['video_url']
         
@@ -291,6 +811,7 @@ def admin_article_new():
         )
         db.session.add(article)
         db.session.commit()
+        content_changed(Article, article.id, article.category)
         flash('تم إضافة المقال بنجاح', 'success')
         return redirect(url_for('admin_articles'))
     return render_template('admin/article_form.html')
@@ -300,6 +821,7 @@ def admin_article_new():
 def admin_article_edit(id):
     article = Article.query.get_or_404(id)
     if request.method == 'POST':
+        old_category = article.category
         article.title = request.form['title']
         article.category = request.form['category']
         article.content = request.form['content']
@@ -307,50 +829,25 @@ def admin_article_edit(id):
         # Handle image upload
         if 'image_file' in request.files and request.files['image_file'].filename:
             image_file = request.files['image_file']
-            if allowed_file(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                # Generate unique filename
-                image_filename = f"{uuid.uuid4().hex}.{image_file.filename.rsplit('.', 1)[1].lower()}"
-                image_filepath = os.path.join(IMAGE_UPLOADS, image_filename)
-                image_file.save(image_filepath)
-                article.image_url = f'/static/uploads/images/{image_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Image for article: {article.title}",
-                    filename=image_filename,
-                    filepath=article.image_url,
-                    filetype='image',
-                    filesize=os.path.getsize(image_filepath),
-                    category='articles'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(image_file, 'articles', f"Image for article: {article.title}", filetype='image')
+            if media is not None:
+                article.image_url = media.filepath
         elif request.form.get('image_url'):
             article.image_url = request.form['image_url']
         
         # Handle video upload
         if 'video_file' in request.files and request.files['video_file'].filename:
             video_file = request.files['video_file']
-            if allowed_file(video_file.filename, ALLOWED_VIDEO_EXTENSIONS):
-                # Generate unique filename
-                video_filename = f"{uuid.uuid4().hex}.{video_file.filename.rsplit('.', 1)[1].lower()}"
-                video_filepath = os.path.join(VIDEO_UPLOADS, video_filename)
-                video_file.save(video_filepath)
-                article.video_url = f'/static/uploads/videos/{video_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Video for article: {article.title}",
-                    filename=video_filename,
-                    filepath=article.video_url,
-                    filetype='video',
-                    filesize=os.path.getsize(video_filepath),
-                    category='articles'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(video_file, 'articles', f"Video for article: {article.title}", filetype='video')
+            if media is not None:
+                article.video_url = media.filepath
         elif request.form.get('video_url'):
             article.video_url = request.form['video_url']
         
         db.session.commit()
+        content_changed(Article, article.id, old_category, article.category)
         flash('تم تحديث المقال بنجاح', 'success')
         return redirect(url_for('admin_articles'))
     return render_template('admin/article_form.html', article=article)
@@ -359,8 +856,10 @@ def admin_article_edit(id):
 @admin_required
 def admin_article_delete(id):
     article = Article.query.get_or_404(id)
-    db.session.delete(article)
+    category = article.category
+    mark_deleted(article)
     db.session.commit()
+    content_changed(Article, id, category)
     flash('Article deleted successfully', 'success')
     return redirect(url_for('admin_articles'))
 
@@ -387,46 +886,20 @@ def admin_exercise_new():
         # Handle image upload or URL
         if 'image_file' in request.files and request.files['image_file'].filename:
             image_file = request.files['image_file']
-            if allowed_file(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                # Generate unique filename
-                image_filename = f"{uuid.uuid4().hex}.{image_file.filename.rsplit('.', 1)[1].lower()}"
-                image_filepath = os.path.join(IMAGE_UPLOADS, image_filename)
-                image_file.save(image_filepath)
-                image_url = f'/static/uploads/images/{image_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Image for {name}",
-                    filename=image_filename,
-                    filepath=image_url,
-                    filetype='image',
-                    filesize=os.path.getsize(image_filepath),
-                    category='exercises'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(image_file, 'exercises', f"Image for {name}", filetype='image')
+            if media is not None:
+                image_url = media.filepath
         elif 'use_image_url' in request.form and request.form.get('image_url'):
             image_url = request.form['image_url']
         
         # Handle video upload or URL
         if 'video_file' in request.files and request.files['video_file'].filename:
             video_file = request.files['video_file']
-            if allowed_file(video_file.filename, ALLOWED_VIDEO_EXTENSIONS):
-                # Generate unique filename
-                video_filename = f"{uuid.uuid4().hex}.{video_file.filename.rsplit('.', 1)[1].lower()}"
-                video_filepath = os.path.join(VIDEO_UPLOADS, video_filename)
-                video_file.save(video_filepath)
-                video_url = f'/static/uploads/videos/{video_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Video for {name}",
-                    filename=video_filename,
-                    filepath=video_url,
-                    filetype='video',
-                    filesize=os.path.getsize(video_filepath),
-                    category='exercises'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(video_file, 'exercises', f"Video for {name}", filetype='video')
+            if media is not None:
+                video_url = media.filepath
         elif 'use_video_url' in request.form and request.form.get('video_url'):
             video_url = request.form['video_url']
         
@@ -440,6 +913,7 @@ def admin_exercise_new():
         )
         db.session.add(exercise)
         db.session.commit()
+        content_changed(Exercise, exercise.id, exercise.category)
         
         flash('تم إضافة التمرين بنجاح', 'success')
         return redirect(url_for('admin_exercises'))
@@ -452,6 +926,7 @@ def admin_exercise_edit(id):
     exercise = Exercise.query.get_or_404(id)
     
     if request.method == 'POST':
+        old_category = exercise.category
         exercise.name = request.form['name']
         exercise.category = request.form['category']
         exercise.description = request.form['description']
@@ -459,50 +934,25 @@ def admin_exercise_edit(id):
         # Handle image upload or URL
         if 'image_file' in request.files and request.files['image_file'].filename:
             image_file = request.files['image_file']
-            if allowed_file(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-                # Generate unique filename
-                image_filename = f"{uuid.uuid4().hex}.{image_file.filename.rsplit('.', 1)[1].lower()}"
-                image_filepath = os.path.join(IMAGE_UPLOADS, image_filename)
-                image_file.save(image_filepath)
-                exercise.image_url = f'/static/uploads/images/{image_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Image for {exercise.name}",
-                    filename=image_filename,
-                    filepath=exercise.image_url,
-                    filetype='image',
-                    filesize=os.path.getsize(image_filepath),
-                    category='exercises'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(image_file, 'exercises', f"Image for {exercise.name}", filetype='image')
+            if media is not None:
+                exercise.image_url = media.filepath
         elif 'use_image_url' in request.form and request.form.get('image_url'):
             exercise.image_url = request.form['image_url']
         
         # Handle video upload or URL
         if 'video_file' in request.files and request.files['video_file'].filename:
             video_file = request.files['video_file']
-            if allowed_file(video_file.filename, ALLOWED_VIDEO_EXTENSIONS):
-                # Generate unique filename
-                video_filename = f"{uuid.uuid4().hex}.{video_file.filename.rsplit('.', 1)[1].lower()}"
-                video_filepath = os.path.join(VIDEO_UPLOADS, video_filename)
-                video_file.save(video_filepath)
-                exercise.video_url = f'/static/uploads/videos/{video_filename}'
-                
-                # Save to media library
-                media = Media(
-                    title=f"Video for {exercise.name}",
-                    filename=video_filename,
-                    filepath=exercise.video_url,
-                    filetype='video',
-                    filesize=os.path.getsize(video_filepath),
-                    category='exercises'
-                )
-                db.session.add(media)
+            # Save to media library (an identical file already stored is reused)
+            media = store_media(video_file, 'exercises', f"Video for {exercise.name}", filetype='video')
+            if media is not None:
+                exercise.video_url = media.filepath
         elif 'use_video_url' in request.form and request.form.get('video_url'):
             exercise.video_url = request.form['video_url']
         
         db.session.commit()
+        content_changed(Exercise, exercise.id, old_category, exercise.category)
         flash('تم تحديث التمرين بنجاح', 'success')
         return redirect(url_for('admin_exercises'))
         
@@ -512,8 +962,10 @@ def admin_exercise_edit(id):
 @admin_required
 def admin_exercise_delete(id):
     exercise = Exercise.query.get_or_404(id)
-    db.session.delete(exercise)
+    category = exercise.category
+    mark_deleted(exercise)
     db.session.commit()
+    content_changed(Exercise, id, category)
     flash('تم حذف التمرين بنجاح', 'success')
     return redirect(url_for('admin_exercises'))
 
@@ -537,6 +989,7 @@ def admin_nutrition_new():
         )
         db.session.add(nutrition)
         db.session.commit()
+        content_changed(Nutrition, nutrition.id, nutrition.category)
         flash('تم إضافة خطة التغذية بنجاح', 'success')
         return redirect(url_for('admin_nutrition'))
     return render_template('admin/nutrition_form.html')
@@ -546,12 +999,14 @@ def admin_nutrition_new():
 def admin_nutrition_edit(id):
     nutrition = Nutrition.query.get_or_404(id)
     if request.method == 'POST':
+        old_category = nutrition.category
         nutrition.title = request.form['title']
         nutrition.category = request.form['category']
         nutrition.calories = request.form['calories']
         nutrition.description = request.form['description']
         nutrition.image_url = request.form['image_url']
         db.session.commit()
+        content_changed(Nutrition, nutrition.id, old_category, nutrition.category)
         flash('تم تحديث خطة التغذية بنجاح', 'success')
         return redirect(url_for('admin_nutrition'))
     return render_template('admin/nutrition_form.html', nutrition=nutrition)
@@ -560,8 +1015,10 @@ def admin_nutrition_edit(id):
 @admin_required
 def admin_nutrition_delete(id):
     nutrition = Nutrition.query.get_or_404(id)
-    db.session.delete(nutrition)
+    category = nutrition.category
+    mark_deleted(nutrition)
     db.session.commit()
+    content_changed(Nutrition, id, category)
     flash('تم حذف خطة التغذية بنجاح', 'success')
     return redirect(url_for('admin_nutrition'))
 
@@ -585,6 +1042,7 @@ def admin_supplement_new():
         )
         db.session.add(supplement)
         db.session.commit()
+        content_changed(Supplement, supplement.id, supplement.category)
         flash('تم إضافة المكمل الغذائي بنجاح', 'success')
         return redirect(url_for('admin_supplements'))
     return render_template('admin/supplement_form.html')
@@ -594,12 +1052,14 @@ def admin_supplement_new():
 def admin_supplement_edit(id):
     supplement = Supplement.query.get_or_404(id)
     if request.method == 'POST':
+        old_category = supplement.category
         supplement.name = request.form['name']
         supplement.category = request.form['category']
         supplement.benefits = request.form['benefits']
         supplement.side_effects = request.form['side_effects']
         supplement.recommended_dosage = request.form['recommended_dosage']
         db.session.commit()
+        content_changed(Supplement, supplement.id, old_category, supplement.category)
         flash('تم تحديث المكمل الغذائي بنجاح', 'success')
         return redirect(url_for('admin_supplements'))
     return render_template('admin/supplement_form.html', supplement=supplement)
@@ -608,8 +1068,10 @@ def admin_supplement_edit(id):
 @admin_required
 def admin_supplement_delete(id):
     supplement = Supplement.query.get_or_404(id)
-    db.session.delete(supplement)
+    category = supplement.category
+    mark_deleted(supplement)
     db.session.commit()
+    content_changed(Supplement, id, category)
     flash('تم حذف المكمل الغذائي بنجاح', 'success')
     return redirect(url_for('admin_supplements'))
 
@@ -632,6 +1094,7 @@ def admin_program_new():
         )
         db.session.add(program)
         db.session.commit()
+        content_changed(TrainingProgram, program.id, program.category)
         flash('تم إضافة برنامج التدريب بنجاح', 'success')
         return redirect(url_for('admin_programs'))
     return render_template('admin/program_form.html')
@@ -641,11 +1104,13 @@ def admin_program_new():
 def admin_program_edit(id):
     program = TrainingProgram.query.get_or_404(id)
     if request.method == 'POST':
+        old_category = program.category
         program.name = request.form['name']
         program.category = request.form['category']
         program.description = request.form['description']
         program.schedule = request.form['schedule']
         db.session.commit()
+        content_changed(TrainingProgram, program.id, old_category, program.category)
         flash('تم تحديث برنامج التدريب بنجاح', 'success')
         return redirect(url_for('admin_programs'))
     return render_template('admin/program_form.html', program=program)
@@ -654,12 +1119,20 @@ def admin_program_edit(id):
 @admin_required
 def admin_program_delete(id):
     program = TrainingProgram.query.get_or_404(id)
-    db.session.delete(program)
+    category = program.category
+    mark_deleted(program)
     db.session.commit()
+    content_changed(TrainingProgram, id, category)
     flash('تم حذف برنامج التدريب بنجاح', 'success')
     return redirect(url_for('admin_programs'))
 
 # إعدادات الموقع
+# إحصائيات ذاكرة التخزين المؤقت للصفحات
+@app.route('/admin/cache-stats')
+@admin_required
+def admin_cache_stats():
+    return jsonify(page_cache.stats())
+
 @app.route('/admin/settings', methods=['GET', 'POST'])
 @admin_required
 def admin_settings():
@@ -675,19 +1148,10 @@ def admin_settings():
 def admin_media():
     page = request.args.get('page', 1, type=int)
     per_page = 24
-    media_query = Media.query.order_by(Media.created_at.desc())
     
     # Aplicar filtros si existen
-    filetype = request.args.get('filetype')
-    category = request.args.get('category')
-    search = request.args.get('search')
-    
-    if filetype:
-        media_query = media_query.filter(Media.filetype == filetype)
-    if category:
-        media_query = media_query.filter(Media.category == category)
-    if search:
-        media_query = media_query.filter(Media.title.ilike(f'%{search}%'))
+    media_query = filtered_media_query(request.args.get('filetype'), request.args.get('category'),
+                                       request.args.get('search'))
     
     media_items = media_query.paginate(page=page, per_page=per_page)
     
@@ -715,48 +1179,20 @@ def admin_media_upload():
         for file in files:
             if file.filename == '':
                 continue
-                
-            original_filename = secure_filename(file.filename)
-            file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-            
-            # Generate unique filename
-            unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
             
-            # Determine file type and appropriate directory
-            if allowed_file(original_filename, ALLOWED_IMAGE_EXTENSIONS):
-                filetype = 'image'
-                filepath = os.path.join(IMAGE_UPLOADS, unique_filename)
-                relative_path = f'/static/uploads/images/{unique_filename}'
-            elif allowed_file(original_filename, ALLOWED_VIDEO_EXTENSIONS):
-                filetype = 'video'
-                filepath = os.path.join(VIDEO_UPLOADS, unique_filename)
-                relative_path = f'/static/uploads/videos/{unique_filename}'
-            else:
+            # Save file and database row, or reuse an identical file already stored
+            media = store_media(file, category)
+            if media is None:
                 continue  # Skip unsupported files
             
-            # Save file
-            file.save(filepath)
-            
-            # Get file size
-            filesize = os.path.getsize(filepath)
-            
-            # Save to database
-            media = Media(
-                title=original_filename.rsplit('.', 1)[0].replace('-', ' ').replace('_', ' ').title(),
-                filename=unique_filename,
-                filepath=relative_path,
-                filetype=filetype,
-                filesize=filesize,
-                category=category
-            )
-            
-            db.session.add(media)
+            db.session.flush()
             uploaded_files.append({
                 'id': media.id,
                 'title': media.title,
                 'filepath': media.filepath,
                 'filetype': media.filetype,
-                'filesize': media.filesize
+                'filesize': media.filesize,
+                'status': media.status
             })
         
         db.session.commit()
@@ -770,36 +1206,384 @@ def admin_media_upload():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.cli.command('generate-variants')
+@click.option('--force', is_flag=True, help='Regenerate images that already have variants.')
+def generate_variants_command(force):
+    """Create the responsive WebP/JPEG variants of the library images."""
+    query = Media.query.filter(Media.filetype == 'image')
+    if not force:
+        query = query.filter(Media.variants.is_(None))
+    count = 0
+    for media in query.all():
+        if os.path.exists(media_path(media)):
+            generate_media_variants(media)
+            db.session.commit()
+            count += 1
+    print(f'Variants generated for {count} images')
+
+# Deduplicación de la biblioteca de medios existente
+MEDIA_URL_COLUMNS = [
+    (Exercise, 'image_url'), (Exercise, 'video_url'),
+    (Nutrition, 'image_url'),
+    (Article, 'image_url'), (Article, 'video_url'),
+]
+
+@app.cli.command('dedupe-media')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+def dedupe_media_command(dry_run):
+    """Hash every media file and merge identical ones into a single row and file."""
+    for media in Media.query.filter(Media.sha256.is_(None)).all():
+        if os.path.exists(media_path(media)):
+            media.sha256 = file_sha256(media_path(media))
+    if not dry_run:
+        db.session.commit()
+
+    duplicates = db.session.execute(
+        db.select(Media.sha256).where(Media.sha256.isnot(None))
+        .group_by(Media.sha256).having(db.func.count() > 1)
+    ).scalars().all()
+
+    removed = freed = 0
+    stale_tags = set()
+    for digest in duplicates:
+        keeper, *copies = Media.query.filter_by(sha256=digest).order_by(Media.id).all()
+        for copy in copies:
+            for model, column in MEDIA_URL_COLUMNS:
+                items = model.query.execution_options(include_deleted=True) \
+                    .filter(getattr(model, column) == copy.filepath).all()
+                table = model.__tablename__
+                for item in items:
+                    setattr(item, column, keeper.filepath)
+                    stale_tags.update((table, f'{table}:{item.id}', f'{table}:{item.category}'))
+            removed += 1
+            freed += copy.filesize or 0
+            if dry_run:
+                continue
+            remove_media_files(copy)
+            db.session.delete(copy)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        page_cache.invalidate(*stale_tags)
+    print(f"{removed} duplicate files {'would be ' if dry_run else ''}removed, {freed / 1024 ** 2:.1f} MB freed")
+
+# Paso de las carpetas planas de subidas a subcarpetas ab/cd/ (ver upload_shard)
+FLAT_UPLOAD_FOLDERS = ('/static/uploads/images/variants/', '/static/uploads/images/', '/static/uploads/videos/')
+
+def sharded_url(url, shard_name=None):
+    """Sharded form of a URL in a flat upload folder, or None if it is not one.
+
+    Variants are sharded by the name of their original image (shard_name).
+    """
+    for folder in FLAT_UPLOAD_FOLDERS:
+        if url and url.startswith(folder):
+            name = url[len(folder):]
+            return None if '/' in name else f'{folder}{upload_shard(shard_name or name)}/{name}'
+    return None
+
+@app.cli.command('shard-uploads')
+@click.option('--dry-run', is_flag=True, help='Only report what would be moved.')
+def shard_uploads_command(dry_run):
+    """Move flat uploads into ab/cd/ subfolders and rewrite media and content URLs in bulk."""
+    moves = {}
+    media_updates = []
+    for media_id, filename, filepath, variants in db.session.execute(
+            db.select(Media.id, Media.filename, Media.filepath, Media.variants)):
+        new_filepath = sharded_url(filepath) or filepath
+        new_variants = variants and {
+            fmt: [dict(entry, url=sharded_url(entry['url'], filename) or entry['url']) for entry in entries]
+            for fmt, entries in variants.items()
+        }
+        if new_filepath == filepath and new_variants == variants:
+            continue
+        moves[filepath] = new_filepath
+        for fmt, entries in (variants or {}).items():
+            moves.update((entry['url'], new_entry['url']) for entry, new_entry in zip(entries, new_variants[fmt]))
+        media_updates.append({'b_id': media_id, 'b_filepath': new_filepath, 'b_variants': new_variants})
+
+    content_updates = []
+    for model, column in MEDIA_URL_COLUMNS:
+        urls = db.session.execute(
+            db.select(getattr(model, column)).distinct()
+            .where(getattr(model, column).like('/static/uploads/%'))
+            .execution_options(include_deleted=True)
+        ).scalars()
+        pairs = [{'b_old': url, 'b_new': sharded_url(url)} for url in urls if sharded_url(url)]
+        moves.update((pair['b_old'], pair['b_new']) for pair in pairs)
+        if pairs:
+            content_updates.append((model, column, pairs))
+
+    moves = {old: new for old, new in moves.items() if old != new}
+    if dry_run:
+        print(f'{len(moves)} files would be moved, {len(media_updates)} media rows and '
+              f'{sum(len(pairs) for _, _, pairs in content_updates)} content URLs rewritten')
+        return
+
+    def to_path(url):
+        return os.path.join(app.static_folder, url.replace('/static/', '', 1))
+
+    moved, missing = [], 0
+    for old, new in moves.items():
+        old_path, new_path = to_path(old), to_path(new)
+        if os.path.exists(old_path):
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+            moved.append((old_path, new_path))
+        elif not os.path.exists(new_path):
+            missing += 1  # already moved by an interrupted run if the new path exists
+
+    try:
+        touched = set()
+        if media_updates:
+            table = Media.__table__
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('b_id')).values(
+                    filepath=bindparam('b_filepath'),
+                    variants=bindparam('b_variants', type_=db.JSON(none_as_null=True))),
+                media_updates)
+            touched.add(table.name)
+        now = datetime.utcnow()
+        for model, column, pairs in content_updates:
+            table = model.__table__
+            # updated_at moves forward so /api/changes clients pick up the new URLs
+            db.session.execute(
+                table.update().where(table.c[column] == bindparam('b_old'))
+                .values({column: bindparam('b_new'), 'updated_at': now}),
+                pairs)
+            touched.add(table.name)
+        if touched:
+            change_stamps.touch(db.session.connection(), *touched)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for old_path, new_path in reversed(moved):
+            os.replace(new_path, old_path)
+        raise
+
+    for old in moves:
+        app_cache.delete(f'variants:{old}')
+    for model in {model for model, _, _ in content_updates}:
+        # Detail pages are tagged with their category, so category tags cover them
+        table = model.__tablename__
+        categories = db.session.execute(db.select(model.category).distinct()).scalars()
+        page_cache.invalidate(table, *[f'{table}:{c}' for c in categories if c])
+    print(f'{len(moved)} files moved ({missing} missing), {len(media_updates)} media rows and '
+          f'{sum(len(pairs) for _, _, pairs in content_updates)} content URLs rewritten')
+
+@app.cli.command('reconcile-media')
+@click.option('--clean', is_flag=True, help='Delete orphaned files and Media rows whose file is missing.')
+@click.option('--workers', default=16, show_default=True, help='Threads listing the upload folders.')
+def reconcile_media_command(clean, workers):
+    """Compare the upload folders with the media table and report orphans and dangling rows."""
+    report = media_reconcile.reconcile(
+        db, Media, [getattr(model, column) for model, column in MEDIA_URL_COLUMNS],
+        app.static_folder, UPLOAD_FOLDER, workers)
+    orphan_size = sum(size for _, size in report['orphans'])
+    print(f"{report['files']} files on disk, {report['rows']} media rows")
+    print(f"{len(report['orphans'])} orphaned files ({orphan_size / 1024 ** 2:.1f} MB)")
+    for path, size in report['orphans'][:50]:
+        print(f'  {os.path.relpath(path, app.static_folder)}  {size / 1024:.0f} KB')
+    print(f"{len(report['dangling'])} media rows with a missing file")
+    for media_id in report['dangling'][:50]:
+        print(f'  #{media_id}')
+    if not clean:
+        return
+
+    removed = media_reconcile.remove_files([path for path, _ in report['orphans']], workers)
+    ids = report['dangling']
+    for start in range(0, len(ids), 500):
+        for media in Media.query.filter(Media.id.in_(ids[start:start + 500])).all():
+            remove_media_files(media)
+            app_cache.delete(f'variants:{media.filepath}')
+            db.session.delete(media)
+        db.session.commit()
+    print(f'{removed} files and {len(ids)} media rows removed')
+
+# Filtros, conteos y facetas de la biblioteca de medios. Los conteos se guardan en
+# la caché con la versión de la tabla media (change_stamps), así que cualquier
+# cambio en la biblioteca los invalida sin tener que borrarlos explícitamente.
+MEDIA_COUNT_TTL = 3600
+
+def filtered_media_query(filetype=None, category=None, search=None):
+    """Media filtered by type, category and title search, newest first"""
+    query = Media.query
+    if filetype:
+        query = query.filter(Media.filetype == filetype)
+    if category:
+        query = query.filter(Media.category == category)
+    if search:
+        if db.engine.dialect.name == 'sqlite':
+            search_index.ensure_search_index(db.session.connection())
+            ids = search_index.matching_ids(search, 'media')
+            if ids is not None:
+                query = query.filter(Media.id.in_(ids))
+        else:
+            query = query.filter(Media.title.ilike(f'{search}%'))
+    return query.order_by(Media.created_at.desc(), Media.id.desc())
+
+def media_version():
+    versions, _ = change_stamps.get([Media.__tablename__])
+    return versions[Media.__tablename__]
+
+def media_count(query, filetype=None, category=None, search=None):
+    key = f"count:media:{media_version()}:{filetype or ''}:{category or ''}:{search or ''}"
+    count = app_cache.get(key)
+    if count is None:
+        count = query.order_by(None).count()
+        app_cache.set(key, count, ttl=MEDIA_COUNT_TTL)
+    return count
+
+def media_facets():
+    """{'total', 'category': {name: count}, 'filetype': {name: count}}, cached until media changes"""
+    key = f'facets:media:{media_version()}'
+    facets = app_cache.get(key)
+    if facets is None:
+        facets = {'total': 0}
+        for column in (Media.category, Media.filetype):
+            rows = db.session.execute(db.select(column, db.func.count()).group_by(column)).all()
+            facets[column.key] = {value or '': count for value, count in rows}
+        facets['total'] = sum(facets['filetype'].values())
+        app_cache.set(key, facets, ttl=MEDIA_COUNT_TTL)
+    return facets
+
+# Subidas reanudables por partes
+def upload_error_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status
+    if error.offset is not None:
+        response.headers['Upload-Offset'] = str(error.offset)
+    return response
+
+@app.route('/admin/media/uploads', methods=['POST'])
+@admin_required
+def admin_media_upload_start():
+    data = request.get_json(silent=True) or {}
+    original_filename = secure_filename(data.get('filename') or '')
+    if media_destination(original_filename) is None:
+        return jsonify({'error': 'Unsupported file type'}), 400
+    try:
+        upload_id = chunked_uploads.start(original_filename, data.get('size'),
+                                          category=data.get('category', 'other'))
+    except UploadError as e:
+        return upload_error_response(e)
+    response = jsonify({'upload_id': upload_id, 'offset': 0})
+    response.status_code = 201
+    response.headers['Location'] = url_for('admin_media_upload_chunk', upload_id=upload_id)
+    return response
+
+@app.route('/admin/media/uploads/<upload_id>', methods=['HEAD', 'GET', 'PATCH', 'DELETE'])
+@admin_required
+def admin_media_upload_chunk(upload_id):
+    try:
+        if request.method == 'DELETE':
+            chunked_uploads.info(upload_id)
+            chunked_uploads.cancel(upload_id)
+            return '', 204
+        if request.method == 'PATCH':
+            offset = request.headers.get('Upload-Offset', type=int)
+            if offset is None:
+                return jsonify({'error': 'Missing Upload-Offset header'}), 400
+            info = chunked_uploads.info(upload_id)
+            info['offset'] = chunked_uploads.write_chunk(upload_id, offset, request.stream)
+        else:
+            info = chunked_uploads.info(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    response = jsonify({'offset': info['offset'], 'size': info['size']})
+    response.headers['Upload-Offset'] = str(info['offset'])
+    response.headers['Upload-Length'] = str(info['size'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/admin/media/uploads/<upload_id>/complete', methods=['POST'])
+@admin_required
+def admin_media_upload_complete(upload_id):
+    try:
+        info = chunked_uploads.info(upload_id)
+        filetype, unique_filename, filepath, relative_path = media_destination(info['filename'])
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        chunked_uploads.complete(upload_id, filepath)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    # Hashing (and deduplication) of the assembled file happens in the media job
+    media = Media(
+        title=media_title(info['filename']),
+        filename=unique_filename,
+        filepath=relative_path,
+        filetype=filetype,
+        filesize=info['size'],
+        category=info.get('category', 'other'),
+        status='pending'
+    )
+    db.session.add(media)
+    db.session.flush()
+    enqueue_media_job(media)
+    # Read before committing: with inline jobs a duplicate row is gone after the commit
+    file_info = {
+        'id': media.id,
+        'title': media.title,
+        'filepath': media.filepath,
+        'filetype': media.filetype,
+        'filesize': media.filesize,
+        'status': media.status
+    }
+    db.session.commit()
+
+    return jsonify({'success': True, 'file': file_info})
+
 # API Endpoint to get media items
 @app.route('/api/media')
 @admin_required
+@change_stamps.conditional('media', cache_control='private, no-cache', anonymous_only=False)
 def api_media():
+    """Cursor-paginated media listing for the admin picker.
+
+    Query parameters: filetype, category, search (full-text, prefix of the
+    last word), limit and cursor. Pagination is described by the
+    X-Total-Count, X-Next-Cursor and Link headers, as in api_list.
+    """
     filetype = request.args.get('filetype')
     category = request.args.get('category')
     search = request.args.get('search')
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
     
-    query = Media.query
+    query = filtered_media_query(filetype, category, search)
+    total = media_count(query, filetype, category, search)
     
-    if filetype:
-        query = query.filter(Media.filetype == filetype)
-    if category:
-        query = query.filter(Media.category == category)
-    if search:
-        query = query.filter(Media.title.ilike(f'%{search}%'))
-    
-    media_items = query.order_by(Media.created_at.desc()).all()
-    
-    result = [{
-        'id': item.id,
-        'title': item.title,
-        'filepath': item.filepath,
-        'filetype': item.filetype,
-        'filesize': item.filesize,
-        'category': item.category,
-        'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    } for item in media_items]
-    
-    return jsonify(result)
+    if request.args.get('cursor'):
+        try:
+            query = query.filter(tuple_(Media.created_at, Media.id) < decode_cursor(request.args['cursor']))
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    fields = ['id', 'title', 'filepath', 'filetype', 'filesize', 'category', 'status', 'created_at']
+    rows = query.with_entities(*[getattr(Media, f) for f in fields]).limit(limit + 1).all()
+    
+    result = rows_to_dicts(fields, rows[:limit])
+    for item in result:
+        item['created_at'] = item['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+    
+    response = json_response(result)
+    response.headers['X-Total-Count'] = str(total)
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[-1], last[0])
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, _external=True, **args)}>; rel="next"'
+    return response
+
+@app.route('/api/media/facets')
+@admin_required
+@change_stamps.conditional('media', cache_control='private, no-cache', anonymous_only=False)
+def api_media_facets():
+    """Item counts per category and per file type for the media filter sidebar"""
+    return json_response(media_facets())
 
 # Delete media
 @app.route('/admin/media/delete/<int:id>', methods=['POST'])
@@ -807,11 +1591,8 @@ def api_media():
 def admin_media_delete(id):
     media = Media.query.get_or_404(id)
     
-    # Delete file from filesystem
-    try:
-        os.remove(os.path.join(app.static_folder, media.filepath.replace('/static/', '')))
-    except (FileNotFoundError, OSError):
-        pass
+    # Delete file and its resized variants from filesystem
+    remove_media_files(media)
     
     # Delete from database
     db.session.delete(media)
@@ -834,12 +1615,86 @@ def admin_media_edit(id):
     
     return jsonify({'success': True})
 
+# Bulk actions on the media library: one transaction for every row, then the
+# files of deleted items are removed concurrently once the commit succeeded.
+MEDIA_BULK_MAX_ITEMS = 1000
+MEDIA_BULK_ACTIONS = ('delete', 'recategorize', 'retitle')
+
+@app.route('/admin/media/bulk', methods=['POST'])
+@admin_required
+def admin_media_bulk():
+    """Apply one action to many media items.
+
+    JSON body: {"action": "delete" | "recategorize" | "retitle", "ids": [...],
+    "category": "..." (recategorize), "title": "..." or "titles": {id: title} (retitle)}.
+    Answers with one result per id: deleted, updated, not_found or invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    ids = data.get('ids')
+    if action not in MEDIA_BULK_ACTIONS:
+        return jsonify({'error': f"action must be one of {', '.join(MEDIA_BULK_ACTIONS)}"}), 400
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'error': 'ids must be a non-empty list of integers'}), 400
+    if len(ids) > MEDIA_BULK_MAX_ITEMS:
+        return jsonify({'error': f'At most {MEDIA_BULK_MAX_ITEMS} items per request'}), 400
+
+    category = (data.get('category') or '').strip()
+    titles = data.get('titles') if isinstance(data.get('titles'), dict) else {}
+    if action == 'recategorize' and not category:
+        return jsonify({'error': 'Missing category'}), 400
+    if action == 'retitle' and not (data.get('title') or titles):
+        return jsonify({'error': 'Missing title or titles'}), 400
+
+    ids = list(dict.fromkeys(ids))
+    items = {media.id: media for media in Media.query.filter(Media.id.in_(ids)).all()}
+    results = []
+    removed_paths, stale_urls = [], []
+    for media_id in ids:
+        media = items.get(media_id)
+        if media is None:
+            results.append({'id': media_id, 'status': 'not_found'})
+            continue
+        if action == 'delete':
+            removed_paths += [media_path(media)] + variant_paths(media.variants, app.static_folder)
+            stale_urls.append(media.filepath)
+            db.session.delete(media)
+            results.append({'id': media_id, 'status': 'deleted'})
+        elif action == 'recategorize':
+            media.category = category[:50]
+            results.append({'id': media_id, 'status': 'updated'})
+        else:
+            title = (titles.get(str(media_id)) or data.get('title') or '').strip()
+            if not title:
+                results.append({'id': media_id, 'status': 'invalid', 'error': 'Missing title'})
+                continue
+            media.title = title[:100]
+            results.append({'id': media_id, 'status': 'updated'})
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    files_removed = media_reconcile.remove_files(removed_paths, workers=8) if removed_paths else 0
+    for url in stale_urls:
+        app_cache.delete(f'variants:{url}')
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({'success': True, 'action': action, 'results': results,
+                    'summary': summary, 'files_removed': files_removed})
+
 # Routes
 @app.route('/')
+@change_stamps.conditional('exercises', 'nutrition', 'articles', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('exercises', 'nutrition', 'articles')
 def home():
-    featured_exercises = Exercise.query.limit(3).all()
-    featured_nutrition = Nutrition.query.limit(3).all()
-    featured_articles = Article.query.limit(3).all()
+    featured_exercises = latest_query(Exercise).limit(3).all()
+    featured_nutrition = latest_query(Nutrition).limit(3).all()
+    featured_articles = latest_query(Article).limit(3).all()
     
     # Create a sample prompt to display on the home page
     sample_workout_prompt = build_prompt(
@@ -870,52 +1725,74 @@ def home():
                            nutrition_prompt=sample_nutrition_prompt)
 
 @app.route('/exercises/<category>')
+@change_stamps.conditional('exercises', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('exercises:{category}')
 def exercises(category):
-    exercises = Exercise.query.filter_by(category=category).all()
+    exercises = category_query(Exercise, category).all()
     return render_template('exercises.html', exercises=exercises, category=category)
 
 @app.route('/exercise/<int:id>')
+@change_stamps.conditional('exercises', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('exercises:{id}')
 def exercise_detail(id):
     exercise = Exercise.query.get_or_404(id)
-    related = Exercise.query.filter_by(category=exercise.category).filter(Exercise.id != id).limit(3).all()
+    page_cache.add_tags(f'exercises:{exercise.category}')
+    related = get_related(Exercise, exercise)
     return render_template('exercise_detail.html', exercise=exercise, related=related)
 
 @app.route('/nutrition/<category>')
+@change_stamps.conditional('nutrition', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('nutrition:{category}')
 def nutrition(category):
-    nutrition_items = Nutrition.query.filter_by(category=category).all()
+    nutrition_items = category_query(Nutrition, category).all()
     return render_template('nutrition.html', nutrition_plans=nutrition_items, category=category)
 
 @app.route('/nutrition/item/<int:id>')
+@change_stamps.conditional('nutrition', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('nutrition:{id}')
 def nutrition_detail(id):
     item = Nutrition.query.get_or_404(id)
-    related = Nutrition.query.filter_by(category=item.category).filter(Nutrition.id != id).limit(3).all()
+    page_cache.add_tags(f'nutrition:{item.category}')
+    related = get_related(Nutrition, item)
     return render_template('nutrition_detail.html', plan=item, related=related)
 
 @app.route('/programs/<category>')
+@change_stamps.conditional('training_programs', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('training_programs:{category}')
 def training_programs(category):
-    programs = TrainingProgram.query.filter_by(category=category).all()
+    programs = category_query(TrainingProgram, category).all()
     return render_template('programs.html', programs=programs, category=category)
 
 @app.route('/program/<int:id>')
+@change_stamps.conditional('training_programs', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('training_programs:{id}')
 def program_detail(id):
     program = TrainingProgram.query.get_or_404(id)
-    related = TrainingProgram.query.filter_by(category=program.category).filter(TrainingProgram.id != id).limit(3).all()
+    page_cache.add_tags(f'training_programs:{program.category}')
+    related = get_related(TrainingProgram, program)
     return render_template('program_detail.html', program=program, related=related)
 
 @app.route('/supplements')
+@change_stamps.conditional('supplements', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('supplements')
 def supplements():
     supplements = Supplement.query.all()
     return render_template('supplements.html', supplements=supplements)
 
 @app.route('/articles/<category>')
+@change_stamps.conditional('articles', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('articles:{category}')
 def articles(category):
-    articles = Article.query.filter_by(category=category).order_by(Article.created_at.desc()).all()
+    articles = category_query(Article, category).all()
     return render_template('articles.html', articles=articles, category=category)
 
 @app.route('/article/<int:id>')
+@change_stamps.conditional('articles', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('articles:{id}')
 def article_detail(id):
     article = Article.query.get_or_404(id)
-    related = Article.query.filter_by(category=article.category).filter(Article.id != id).limit(3).all()
+    page_cache.add_tags(f'articles:{article.category}')
+    related = get_related(Article, article)
     return render_template('article_detail.html', article=article, related=related)
 
 @app.route('/calculators')
@@ -924,24 +1801,60 @@ def calculators():
 
 @app.route('/search')
 def search():
-    query = request.args.get('q', '')
+    query = request.args.get('q', '').strip()
     if not query:
         return render_template('search.html', results=None)
 
-    exercises = Exercise.query.filter(Exercise.name.ilike(f'%{query}%') | 
-                                     Exercise.description.ilike(f'%{query}%')).all()
-    nutrition = Nutrition.query.filter(Nutrition.title.ilike(f'%{query}%') | 
-                                      Nutrition.description.ilike(f'%{query}%')).all()
-    articles = Article.query.filter(Article.title.ilike(f'%{query}%') | 
-                                   Article.content.ilike(f'%{query}%')).all()
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
+    models = {'exercise': Exercise, 'nutrition': Nutrition, 'article': Article}
+
+    if db.engine.dialect.name == 'sqlite':
+        # Ranked full-text search (BM25) over the normalised index
+        total, hits = search_index.search(db.session.connection(), query, kinds=list(models),
+                                          page=page, per_page=per_page)
+    else:
+        # Other databases: plain substring search, unranked. Totals come from
+        # COUNT queries; the page is read with OFFSET/LIMIT across the types in turn.
+        hits = []
+        total = 0
+        skip = (page - 1) * per_page
+        for kind, model, title, body in [('exercise', Exercise, Exercise.name, Exercise.description),
+                                         ('nutrition', Nutrition, Nutrition.title, Nutrition.description),
+                                         ('article', Article, Article.title, Article.content)]:
+            matches = model.query.filter(title.ilike(f'%{query}%') | body.ilike(f'%{query}%'))
+            count = matches.count()
+            total += count
+            if skip >= count:
+                skip -= count
+                continue
+            if len(hits) < per_page:
+                ids = matches.with_entities(model.id).order_by(model.id).offset(skip).limit(per_page - len(hits)).all()
+                hits.extend((kind, item_id) for (item_id,) in ids)
+            skip = 0
+
+    # One query per content type for the current page, then restore the ranking
+    loaded = {}
+    for kind, model in models.items():
+        ids = [item_id for hit_kind, item_id in hits if hit_kind == kind]
+        if ids:
+            loaded.update({(kind, item.id): item for item in model.query.filter(model.id.in_(ids)).all()})
+    results = [{'kind': kind, 'item': loaded[(kind, item_id)]} for kind, item_id in hits if (kind, item_id) in loaded]
 
     return render_template('search.html', 
                            query=query,
-                           exercises=exercises,
-                           nutrition=nutrition,
-                           articles=articles)
+                           results=results,
+                           exercises=[r['item'] for r in results if r['kind'] == 'exercise'],
+                           nutrition=[r['item'] for r in results if r['kind'] == 'nutrition'],
+                           articles=[r['item'] for r in results if r['kind'] == 'article'],
+                           page=page,
+                           per_page=per_page,
+                           total=total,
+                           pages=(total + per_page - 1) // per_page)
 
 @app.route('/videos')
+@change_stamps.conditional('exercises', cache_control=PAGE_CACHE_CONTROL)
+@page_cache.cached('exercises')
 def videos():
     exercises_with_videos = Exercise.query.filter(Exercise.video_url.isnot(None)).all()
     return render_template('videos.html', exercises=exercises_with_videos)
@@ -1338,6 +2251,20 @@ def page_not_found(e):
 def server_error(e):
     return render_template('500.html'), 500
 
+# Imagen adaptable: <picture> con srcset de las variantes WebP/JPEG de una imagen subida
+@app.template_global()
+def responsive_image(url, alt='', sizes='100vw', **attrs):
+    variants = None
+    if url and url.startswith('/static/uploads/images/'):
+        key = f'variants:{url}'
+        variants = app_cache.get(key)
+        if variants is None:
+            variants = db.session.execute(
+                db.select(Media.variants).where(Media.filename == os.path.basename(url), Media.filepath == url)
+            ).scalar() or {}
+            app_cache.set(key, variants, ttl=3600)
+    return picture_tag(url or '', variants, alt=alt, sizes=sizes, **attrs)
+
 # Filtro personalizado para formatear fechas
 @app.template_filter('format_date')
 def format_date(date):
@@ -1366,13 +2293,25 @@ def chatbot():
     
     # Use AI-powered response if available, fallback to rule-based
     try:
-        from ai_helper import get_ai_response, enhance_chatbot_response
+        from ai_helper import get_ai_response, enhance_chatbot_response, save_message
+        
+        # Keep the transcript so it can be searched from the admin panel
+        if session_id:
+            save_message(session_id, user_id, user_message, 'user')
         
         # Get AI response and enhance it for display
         raw_response = get_ai_response(user_message, conversation_history, session_id)
+        if session_id:
+            save_message(session_id, user_id, raw_response, 'assistant')
         response = enhance_chatbot_response(raw_response)
     except Exception as e:
         print(f"Error using AI response: {e}")
+        if session_id:
+            try:
+                from ai_helper import record_failed_response
+                record_failed_response(session_id)
+            except ImportError:
+                pass
         # Return an error if this is a request specifically expecting AI
         if any(keyword in user_message.lower() for keyword in ['ذكاء', 'ai', 'gpt']):
             return jsonify({
@@ -2041,17 +2980,53 @@ def admin_chatbot():
         'content_category': 'fitness_only',
         'safety_level': 'strict',
         'medical_disclaimer': True,
-        'usage_count': 325,
-        'avg_response_time': 2.1,
-        'last_update': '2024-05-15',
-        'usage_logs': [
-            {'id': 1, 'timestamp': '2025-05-16 20:30', 'response_time': 1.8, 'success': True},
-            {'id': 2, 'timestamp': '2025-05-16 19:45', 'response_time': 2.2, 'success': True},
-            {'id': 3, 'timestamp': '2025-05-16 19:10', 'response_time': 2.0, 'success': True}
-        ]
+        'last_update': '2024-05-15'
     }
+    
+    # Usage numbers come from the pre-aggregated rollup tables
+    from ai_helper import CONVERSATION_DB_PATH
+    from chat_stats import get_usage_summary
+    usage = get_usage_summary(CONVERSATION_DB_PATH)
+    generator_data.update({
+        'usage_count': usage['usage_count'],
+        'avg_response_time': usage['avg_response_time'],
+        'sessions_count': usage['sessions'],
+        'avg_turns': usage['avg_turns'],
+        'success_rate': usage['success_rate'],
+        'daily_usage': usage['daily'],
+        'usage_logs': [{
+            'id': i + 1,
+            'timestamp': day['day'],
+            'response_time': day['avg_response_time'],
+            'success': day['failures'] == 0,
+            'success_rate': day['success_rate']
+        } for i, day in enumerate(usage['daily'])]
+    })
     return render_template('admin/generator_control.html', **generator_data)
 
+# البحث في محادثات المدرب الافتراضي
+@app.route('/admin/conversations')
+@admin_required
+def admin_conversations():
+    from ai_helper import search_conversations
+    
+    query = request.args.get('q', '').strip()
+    role = request.args.get('role') or None
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
+    
+    total, results = 0, []
+    if query:
+        total, results = search_conversations(query, role=role, limit=per_page, offset=(page - 1) * per_page)
+    
+    return render_template('admin/conversations.html',
+                           query=query,
+                           role=role,
+                           page=page,
+                           per_page=per_page,
+                           total=total,
+                           results=results)
+
 @app.route('/admin/body-analyzer')
 @admin_required
 def admin_body_analyzer():
@@ -2113,43 +3088,23 @@ def save_generator_settings():
     
     # سيتم إضافة منطق حفظ الإعدادات الفعلي هنا
     
-# إعداد ChromaDB
-client = chromadb.Client(Settings(
-    persist_directory="chroma_db"  # مسار حفظ البيانات
-))
-
-# إنشاء مجموعة للتمارين
-exercises_collection = client.create_collection("exercises")
-nutrition_collection = client.create_collection("nutrition")
-
-# تحميل نموذج التحويل إلى متجهات
-embedder = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-
-# مثال: إضافة تمرين
-exercise = {
-    "id": "1",
-    "name": "تمرين الضغط",
-    "description": "تمرين لتقوية عضلات الصدر والذراعين."
-}
-embedding = embedder.encode([exercise["description"]])[0]
-exercises_collection.add(
-    documents=[exercise["description"]],
-    embeddings=[embedding],
-    ids=[exercise["id"]]
-)
-
-# مثال: إضافة وجبة
-meal = {
-    "id": "1",
-    "title": "وجبة إفطار صحية",
-    "description": "شوفان مع حليب وموز."
-}
-embedding = embedder.encode([meal["description"]])[0]
-nutrition_collection.add(
-    documents=[meal["description"]],
-    embeddings=[embedding],
-    ids=[meal["id"]]
+# Índice semántico (Chroma) de ejercicios y nutrición: los cambios se vuelven a
+# vectorizar al confirmar la transacción (ver semantic_index.py)
+semantic_index = SemanticIndex(
+    app, db,
+    persist_directory=os.getenv('CHROMA_PATH', 'chroma_db'),
+    model_name=os.getenv('EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'),
+    workers=int(os.getenv('SEMANTIC_INDEX_WORKERS', '1'))
 )
+semantic_index.register(Exercise, 'name', 'description')
+semantic_index.register(Nutrition, 'title', 'description')
+
+@app.cli.command('reindex-semantic')
+@click.argument('table', required=False, type=click.Choice(['exercises', 'nutrition']))
+def reindex_semantic_command(table):
+    """Embed every exercise and nutrition row into the Chroma collections."""
+    for name in [table] if table else list(semantic_index.sources):
+        print(f'{name}: {semantic_index.backfill(name)} rows indexed')
 
 if __name__ == '__main__':
     # Initialize the database and model within app context
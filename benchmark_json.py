@@ -0,0 +1,77 @@
+"""
+Mide el coste por fila de las respuestas JSON de las APIs de listados.
+
+Compara tres formas de serializar N ejercicios de una base de datos SQLite
+en memoria:
+
+    orm + json      instancias ORM -> dict -> json de la biblioteca estándar (antes)
+    rows + json     tuplas de columnas (with_entities) -> json estándar
+    rows + fast     tuplas de columnas -> fast_json (orjson si está instalado)
+
+y además el coste de solo codificar las mismas filas con cada backend.
+
+Uso:
+    python benchmark_json.py [filas]
+"""
+
+import json
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from app import db, Exercise, API_FEEDS
+import fast_json
+
+
+def timed(func, repeat=5):
+    """Mejor tiempo de varias ejecuciones, en segundos"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark(rows=20000):
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Exercise.__table__), [{
+            'name': f'تمرين رقم {i}', 'category': 'beginners',
+            'description': 'وصف التمرين وخطوات أدائه بالتفصيل ' * 4,
+            'video_url': f'/static/uploads/videos/{i}.mp4', 'image_url': None,
+            'created_at': now, 'updated_at': now
+        } for i in range(rows)])
+
+    fields = API_FEEDS['exercises'][1]
+    columns = [getattr(Exercise, f) for f in fields]
+
+    with Session(engine) as session:
+        def orm_json():
+            items = session.scalars(select(Exercise)).all()
+            json.dumps([{f: getattr(item, f) for f in fields} for item in items])
+            session.expunge_all()
+
+        def rows_json():
+            json.dumps([dict(zip(fields, row)) for row in session.execute(select(*columns))])
+
+        def rows_fast():
+            fast_json.dumps(fast_json.rows_to_dicts(fields, session.execute(select(*columns)).all()))
+
+        # Solo la codificación, sobre los mismos diccionarios
+        dicts = fast_json.rows_to_dicts(fields, session.execute(select(*columns)).all())
+
+        print(f'{rows} filas, backend rápido: {fast_json.BACKEND}')
+        for name, func in (('orm + json', orm_json), ('rows + json', rows_json), ('rows + fast', rows_fast),
+                           ('solo json', lambda: json.dumps(dicts)),
+                           ('solo fast', lambda: fast_json.dumps(dicts))):
+            elapsed = timed(func)
+            print(f'{name:12} {elapsed * 1000:9.1f} ms  {elapsed / rows * 1e6:7.2f} µs/fila')
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
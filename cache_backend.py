@@ -0,0 +1,196 @@
+"""
+Pluggable key/value cache backends shared by the app and the chatbot.
+
+Three backends are available:
+    - memory: per-process dictionary (default, single worker only)
+    - sqlite: a SQLite file shared by every worker on the same host
+    - redis:  a network cache shared by every worker and host
+
+All backends store JSON-serialisable values and expire entries after a TTL.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache.db')
+
+
+class MemoryCache:
+    """In-process cache. Fast, but every worker has its own copy."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for key in expired:
+                del self._data[key]
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite file, visible to every worker on the host."""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache (expires_at)')
+        conn.commit()
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers and the writer run concurrently
+        # (reopened after a fork so workers never share a handle)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False), expires_at)
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        conn.commit()
+
+    def purge_expired(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        conn.commit()
+
+
+class RedisCache:
+    """Network cache backed by Redis (or any client with the same API).
+
+    Args:
+        client: object exposing get(key), set(key, value, ex=None) and delete(key)
+        prefix (str): namespace prepended to every key
+    """
+
+    def __init__(self, client, prefix='powergym:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix='powergym:'):
+        import redis
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def purge_expired(self):
+        # Redis expires keys on its own
+        pass
+
+
+class LocalRedisClient:
+    """Local stand-in for a Redis client, used for tests and development.
+
+    Implements the small subset of the redis-py API used by RedisCache.
+    """
+
+    def __init__(self):
+        self._cache = MemoryCache()
+
+    def get(self, key):
+        value = self._cache.get(key)
+        return value.encode() if value is not None else None
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, bytes):
+            value = value.decode()
+        self._cache.set(key, value, ttl=ex)
+        return True
+
+    def delete(self, key):
+        self._cache.delete(key)
+        return 1
+
+
+def create_cache(backend=None, url=None):
+    """Build a cache backend from its name.
+
+    Args:
+        backend (str): 'memory', 'sqlite', 'redis' or 'local-redis'.
+            Defaults to the CACHE_BACKEND environment variable, then 'memory'.
+        url (str): SQLite file path or Redis URL. Defaults to CACHE_URL.
+
+    Returns:
+        A cache object exposing get, set, delete and purge_expired.
+    """
+    backend = (backend or os.getenv('CACHE_BACKEND') or 'memory').lower()
+    url = url or os.getenv('CACHE_URL')
+
+    if backend == 'memory':
+        return MemoryCache()
+    if backend == 'sqlite':
+        return SQLiteCache(url or DEFAULT_SQLITE_PATH)
+    if backend == 'redis':
+        return RedisCache.from_url(url or 'redis://localhost:6379/0')
+    if backend == 'local-redis':
+        return RedisCache(LocalRedisClient())
+    raise ValueError(f"Unknown cache backend: {backend}")
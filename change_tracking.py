@@ -0,0 +1,37 @@
+"""
+updated_at / deleted_at columns for the content tables.
+
+Deleting an item only sets deleted_at (a tombstone), so clients syncing
+through /api/changes learn about the deletion. Tombstones are hidden from
+every ORM query by a do_orm_execute hook; pass
+execution_options(include_deleted=True) to see them.
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, DateTime, event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+
+class ChangeTrackingMixin:
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = Column(DateTime)
+
+
+def mark_deleted(obj):
+    """Turn obj into a tombstone (commit afterwards)."""
+    now = datetime.utcnow()
+    obj.deleted_at = now
+    obj.updated_at = now
+
+
+def hide_deleted(*models):
+    """Filter tombstones of these models out of every ORM SELECT."""
+    criteria = [with_loader_criteria(model, model.deleted_at.is_(None), include_aliases=True)
+                for model in models]
+
+    def _filter(state):
+        if (state.is_select and not state.is_column_load and not state.is_relationship_load
+                and not state.execution_options.get('include_deleted', False)):
+            state.statement = state.statement.options(*criteria)
+
+    event.listen(Session, 'do_orm_execute', _filter)
@@ -0,0 +1,248 @@
+"""
+Incremental usage rollups for the virtual coach.
+
+Every message saved by ai_helper.save_message is queued here and folded into
+small rollup tables by a background thread, so the admin dashboard reads a
+handful of rows instead of scanning the whole transcript table. Questions the
+AI could not answer are queued the same way and counted as failures.
+"""
+
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+_events = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+# Maximum number of queued messages applied in a single transaction
+BATCH_SIZE = 200
+
+
+def create_rollup_tables(conn):
+    """Create the rollup tables. Returns True if they did not exist yet."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chat_totals'"
+    ).fetchone() is not None
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS chat_daily_stats (
+        day TEXT PRIMARY KEY,
+        messages INTEGER NOT NULL DEFAULT 0,
+        user_messages INTEGER NOT NULL DEFAULT 0,
+        assistant_messages INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        latency_total REAL NOT NULL DEFAULT 0,
+        latency_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS chat_session_days (
+        day TEXT,
+        session_id TEXT,
+        PRIMARY KEY (day, session_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS chat_session_stats (
+        session_id TEXT PRIMARY KEY,
+        first_day TEXT,
+        turns INTEGER NOT NULL DEFAULT 0,
+        last_user_at TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS chat_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        messages INTEGER NOT NULL DEFAULT 0,
+        user_messages INTEGER NOT NULL DEFAULT 0,
+        assistant_messages INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        latency_total REAL NOT NULL DEFAULT 0,
+        latency_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    # Tables created before failures were tracked
+    for table in ('chat_daily_stats', 'chat_totals'):
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for column in ('assistant_messages', 'failures'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+                if table == 'chat_totals' and column == 'assistant_messages':
+                    conn.execute(
+                        'UPDATE chat_totals SET assistant_messages = '
+                        '(SELECT COALESCE(SUM(assistant_messages), 0) FROM chat_daily_stats)'
+                    )
+    conn.execute('INSERT OR IGNORE INTO chat_totals (id) VALUES (1)')
+    return not exists
+
+
+def _apply(conn, session_id, role, timestamp):
+    """Fold one message into the rollup tables (caller commits)."""
+    day = timestamp[:10]
+    is_user = 1 if role == 'user' else 0
+
+    conn.execute('INSERT OR IGNORE INTO chat_daily_stats (day) VALUES (?)', (day,))
+    conn.execute(
+        'UPDATE chat_daily_stats SET messages = messages + 1, '
+        'user_messages = user_messages + ?, assistant_messages = assistant_messages + ? WHERE day = ?',
+        (is_user, 1 - is_user, day)
+    )
+    conn.execute(
+        'UPDATE chat_totals SET messages = messages + 1, '
+        'user_messages = user_messages + ?, assistant_messages = assistant_messages + ? WHERE id = 1',
+        (is_user, 1 - is_user)
+    )
+
+    # Sessions are counted once per day and once overall
+    if conn.execute(
+        'INSERT OR IGNORE INTO chat_session_days (day, session_id) VALUES (?, ?)', (day, session_id)
+    ).rowcount:
+        conn.execute('UPDATE chat_daily_stats SET sessions = sessions + 1 WHERE day = ?', (day,))
+    if conn.execute(
+        'INSERT OR IGNORE INTO chat_session_stats (session_id, first_day) VALUES (?, ?)', (session_id, day)
+    ).rowcount:
+        conn.execute('UPDATE chat_totals SET sessions = sessions + 1 WHERE id = 1')
+
+    if is_user:
+        conn.execute(
+            'UPDATE chat_session_stats SET turns = turns + 1, last_user_at = ? WHERE session_id = ?',
+            (timestamp, session_id)
+        )
+        return
+
+    # Assistant latency is measured from the question it answers
+    row = conn.execute(
+        'SELECT last_user_at FROM chat_session_stats WHERE session_id = ?', (session_id,)
+    ).fetchone()
+    if row and row[0]:
+        latency = (datetime.fromisoformat(timestamp) - datetime.fromisoformat(row[0])).total_seconds()
+        conn.execute(
+            'UPDATE chat_daily_stats SET latency_total = latency_total + ?, latency_count = latency_count + 1 '
+            'WHERE day = ?',
+            (latency, day)
+        )
+        conn.execute(
+            'UPDATE chat_totals SET latency_total = latency_total + ?, latency_count = latency_count + 1 WHERE id = 1',
+            (latency,)
+        )
+        conn.execute('UPDATE chat_session_stats SET last_user_at = NULL WHERE session_id = ?', (session_id,))
+
+
+def _apply_failure(conn, session_id, timestamp):
+    """Count a question the AI failed to answer (caller commits)."""
+    day = timestamp[:10]
+    conn.execute('INSERT OR IGNORE INTO chat_daily_stats (day) VALUES (?)', (day,))
+    conn.execute('UPDATE chat_daily_stats SET failures = failures + 1 WHERE day = ?', (day,))
+    conn.execute('UPDATE chat_totals SET failures = failures + 1 WHERE id = 1')
+    conn.execute('UPDATE chat_session_stats SET last_user_at = NULL WHERE session_id = ?', (session_id,))
+
+
+def rebuild_rollups(db_path):
+    """Recompute every rollup table from the stored transcripts.
+
+    Failures are not part of the transcripts, so they start again from zero.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        for table in ('chat_daily_stats', 'chat_session_days', 'chat_session_stats', 'chat_totals'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('INSERT INTO chat_totals (id) VALUES (1)')
+        rows = conn.execute('SELECT session_id, role, timestamp FROM conversations ORDER BY timestamp')
+        for session_id, role, timestamp in rows.fetchall():
+            _apply(conn, session_id, role, timestamp)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run(db_path):
+    conn = sqlite3.connect(db_path, timeout=10)
+    while True:
+        batch = [_events.get()]
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(_events.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for session_id, role, timestamp in batch:
+                if role is None:
+                    _apply_failure(conn, session_id, timestamp)
+                else:
+                    _apply(conn, session_id, role, timestamp)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error al actualizar estadísticas del chatbot: {str(e)}")
+        finally:
+            for _ in batch:
+                _events.task_done()
+
+
+def record_message(db_path, session_id, role, timestamp):
+    """Queue a saved message for the background rollup worker.
+
+    A role of None records a failed AI response instead of a message.
+    """
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_run, args=(db_path,), daemon=True, name='chat-stats')
+                _worker.start()
+    _events.put((session_id, role, timestamp))
+
+
+def _success_rate(answered, failures):
+    attempts = answered + failures
+    return round(100.0 * answered / attempts, 1) if attempts else 100.0
+
+
+def get_usage_summary(db_path, days=7):
+    """Read the dashboard numbers from the rollup tables.
+
+    Args:
+        db_path (str): Path to conversations.db
+        days (int): Number of most recent days to include in the daily breakdown
+
+    Returns:
+        dict: usage_count, sessions, avg_turns, avg_response_time, failures,
+        success_rate and a daily list
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        totals = conn.execute(
+            'SELECT messages, user_messages, assistant_messages, failures, sessions, latency_total, latency_count '
+            'FROM chat_totals WHERE id = 1'
+        ).fetchone() or (0, 0, 0, 0, 0, 0, 0)
+        daily = conn.execute(
+            'SELECT day, messages, assistant_messages, failures, sessions, latency_total, latency_count '
+            'FROM chat_daily_stats '
+            'ORDER BY day DESC LIMIT ?',
+            (days,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    messages, user_messages, answered, failures, sessions, latency_total, latency_count = totals
+    return {
+        'messages': messages,
+        'usage_count': user_messages,
+        'sessions': sessions,
+        'avg_turns': round(user_messages / sessions, 1) if sessions else 0,
+        'avg_response_time': round(latency_total / latency_count, 1) if latency_count else 0,
+        'failures': failures,
+        'success_rate': _success_rate(answered, failures),
+        'daily': [{
+            'day': day,
+            'messages': day_messages,
+            'sessions': day_sessions,
+            'failures': day_failures,
+            'success_rate': _success_rate(day_answered, day_failures),
+            'avg_response_time': round(day_latency / day_latency_count, 1) if day_latency_count else 0
+        } for day, day_messages, day_answered, day_failures, day_sessions, day_latency, day_latency_count in daily]
+    }
@@ -0,0 +1,83 @@
+"""
+Comprueba los planes de ejecución (EXPLAIN QUERY PLAN) de las consultas más
+usadas por las páginas públicas y el panel de administración.
+
+Los planes se calculan sobre una base de datos SQLite en memoria creada a
+partir de los modelos, así que un cambio en un modelo o en una consulta que
+elimine un índice hace fallar la comprobación.
+
+Uso:
+    python check_query_plans.py
+
+Termina con código 1 si alguna consulta recorre una tabla completa o necesita
+ordenar con un B-tree temporal.
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import create_engine, text, tuple_
+from app import (app, db, Exercise, Nutrition, Supplement, TrainingProgram, Article, Media, related_items,
+                 category_query, latest_query, related_query, keyset_query, filtered_media_query)
+
+
+def hot_queries():
+    """Devuelve (nombre, consulta) para cada consulta que debe usar un índice"""
+    queries = []
+    for model in (Exercise, Nutrition, TrainingProgram, Article):
+        name = model.__tablename__
+        queries.append((f'{name}: category listing', category_query(model, 'beginners')))
+        queries.append((f'{name}: featured', latest_query(model).limit(3)))
+        queries.append((f'{name}: related', related_items.query(model, 1)))
+        queries.append((f'{name}: related fallback', related_query(model, model(id=1, category='beginners'))))
+        queries.append((f'{name}: admin listing', latest_query(model)))
+        queries.append((f'{name}: api page', keyset_query(model, 'beginners', (datetime(2024, 1, 1), 10))))
+        queries.append((f'{name}: api page (all)', keyset_query(model, None, (datetime(2024, 1, 1), 10))))
+
+    for model in (Exercise, Nutrition, Supplement, TrainingProgram, Article):
+        queries.append((f'{model.__tablename__}: changes feed', model.query.order_by(model.updated_at, model.id)
+                        .filter(tuple_(model.updated_at, model.id) > (datetime(2024, 1, 1), 10))))
+
+    queries.append(('media: admin listing', latest_query(Media)))
+    queries.append(('media: by category', latest_query(Media).filter(Media.category == 'exercises')))
+    queries.append(('media: by filetype', latest_query(Media).filter(Media.filetype == 'image')))
+    after = (datetime(2024, 1, 1), 10)
+    for name, filters in (('all', {}), ('category', {'category': 'exercises'}), ('filetype', {'filetype': 'image'})):
+        queries.append((f'media: api page ({name})', filtered_media_query(**filters)
+                        .filter(tuple_(Media.created_at, Media.id) < after)))
+    queries.append(('media: category facets', db.session.query(Media.category, db.func.count()).group_by(Media.category)))
+    queries.append(('media: filetype facets', db.session.query(Media.filetype, db.func.count()).group_by(Media.filetype)))
+    return queries
+
+
+def explain(conn, query):
+    """Devuelve los pasos del plan de ejecución de una consulta"""
+    compiled = query.statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+
+def bad_steps(plan):
+    """Pasos que indican un recorrido completo o una ordenación sin índice"""
+    return [step for step in plan
+            if (step.startswith('SCAN ') and ' USING ' not in step) or 'USE TEMP B-TREE' in step]
+
+
+def check_query_plans():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+
+    failures = 0
+    with app.app_context(), engine.connect() as conn:
+        for name, query in hot_queries():
+            plan = explain(conn, query)
+            problems = bad_steps(plan)
+            status = 'FAIL' if problems else 'ok'
+            print(f"[{status}] {name}: {' | '.join(plan)}")
+            if problems:
+                failures += 1
+
+    print(f"\n{failures} consulta(s) sin índice adecuado" if failures else "\nTodas las consultas usan índices")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
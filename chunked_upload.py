@@ -0,0 +1,139 @@
+"""
+Resumable chunked uploads for large media files.
+
+Protocol (all routes under /admin/media/uploads, see app.py):
+
+    POST   /admin/media/uploads                {filename, size, category}  -> {upload_id, offset: 0}
+    HEAD   /admin/media/uploads/<upload_id>    current offset in the Upload-Offset header
+    PATCH  /admin/media/uploads/<upload_id>    raw chunk body, Upload-Offset: <offset>
+    POST   /admin/media/uploads/<upload_id>/complete   -> Media row
+    DELETE /admin/media/uploads/<upload_id>    abandon the upload
+
+Chunks are streamed from the request body straight onto the end of a .part
+file, so a worker never holds more than one block in memory, and after a
+network error the client asks for the offset and resends from there instead
+of starting again.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+BLOCK_SIZE = 1024 * 1024
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Invalid request for an upload; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """Pending uploads stored as <id>.part (data) and <id>.json (metadata) in a directory.
+
+    Args:
+        directory (str): where pending uploads are kept; should be on the same
+            filesystem as the upload folders so completing is a rename
+        max_size (int): largest file accepted, in bytes
+    """
+
+    def __init__(self, directory, max_size=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('Unknown upload', 404)
+        base = os.path.join(self.directory, upload_id)
+        return base + '.part', base + '.json'
+
+    def start(self, filename, size, **metadata):
+        """Register a new upload and return its id."""
+        if not filename:
+            raise UploadError('Missing filename')
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('Missing or invalid size')
+        if size > self.max_size:
+            raise UploadError('File too large', 413)
+
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(metadata, filename=filename, size=size, started_at=time.time()), f)
+        return upload_id
+
+    def info(self, upload_id):
+        """Metadata of an upload plus its current offset."""
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                info = json.load(f)
+            info['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise UploadError('Unknown upload', 404)
+        return info
+
+    def write_chunk(self, upload_id, offset, stream):
+        """Append a chunk read from stream, which must start at the current offset.
+
+        Returns the new offset.
+        """
+        info = self.info(upload_id)
+        if offset != info['offset']:
+            raise UploadError('Offset mismatch', 409, offset=info['offset'])
+
+        part_path, _ = self._paths(upload_id)
+        written = info['offset']
+        with open(part_path, 'ab') as f:
+            while True:
+                block = stream.read(BLOCK_SIZE)
+                if not block:
+                    break
+                if written + len(block) > info['size']:
+                    f.truncate(info['offset'])
+                    raise UploadError('Chunk goes past the declared size', 413, offset=info['offset'])
+                f.write(block)
+                written += len(block)
+        return written
+
+    def complete(self, upload_id, destination):
+        """Move a fully received upload to destination and return its metadata."""
+        info = self.info(upload_id)
+        if info['offset'] != info['size']:
+            raise UploadError('Upload is not complete', 409, offset=info['offset'])
+        part_path, meta_path = self._paths(upload_id)
+        shutil.move(part_path, destination)
+        os.remove(meta_path)
+        return info
+
+    def cancel(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_stale(self, max_age=24 * 3600):
+        """Remove uploads with no chunk received for max_age seconds. Returns how many."""
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            upload_id = entry.name[:-len('.json')]
+            if not entry.name.endswith('.json') or not _UPLOAD_ID.match(upload_id):
+                continue
+            part_path, _ = self._paths(upload_id)
+            # The .part file is touched by every chunk, so its mtime is the last activity
+            last_activity = os.path.getmtime(part_path) if os.path.exists(part_path) else entry.stat().st_mtime
+            if now - last_activity > max_age:
+                self.cancel(upload_id)
+                removed += 1
+        return removed
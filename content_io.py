@@ -0,0 +1,232 @@
+"""
+Streaming import/export of the content tables.
+
+    flask content export exercises -o exercises.jsonl
+    flask content export all -o backup/ --format csv
+    flask content import exercises exercises.jsonl --mode upsert
+
+Rows are read and written one at a time (JSONL or CSV) and imported with
+bulk Core INSERT / upsert statements in chunked transactions, so memory use
+stays flat whatever the size of the catalogue. JSON columns are written as
+JSON text in CSV files and parsed back on import.
+"""
+
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import JSON, DateTime, Integer, Float, func, insert, select, text
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _open_output(path):
+    if path == '-':
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def export_table(db, table, out, fmt='jsonl', batch_size=1000):
+    """Write every row of a table to an open file. Returns the row count."""
+    columns = [column.name for column in table.columns]
+    result = db.session.execute(
+        select(*table.columns).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+    )
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(columns)
+
+    json_columns = {i for i, column in enumerate(table.columns) if isinstance(column.type, JSON)}
+    count = 0
+    for row in result:
+        values = [_serialize(value) for value in row]
+        if writer:
+            writer.writerow(['' if value is None
+                             else json.dumps(value, ensure_ascii=False) if i in json_columns
+                             else value for i, value in enumerate(values)])
+        else:
+            out.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def _read_rows(path, fmt):
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key: (value if value != '' else None) for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _coerce(table, row):
+    """Keep known columns and convert text values to the column types."""
+    values = {}
+    for column in table.columns:
+        if column.name not in row:
+            continue
+        value = row[column.name]
+        if isinstance(value, str):
+            if isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif isinstance(column.type, Integer):
+                value = int(value)
+            elif isinstance(column.type, Float):
+                value = float(value)
+            elif isinstance(column.type, JSON):
+                value = json.loads(value)
+        values[column.name] = value
+    if 'created_at' in table.columns and values.get('created_at') is None:
+        values['created_at'] = datetime.utcnow()
+    # Imported rows are changes: a kept (older) updated_at would hide them from
+    # /api/changes clients whose cursor is already past it
+    if 'updated_at' in table.columns:
+        values['updated_at'] = datetime.utcnow()
+    return values
+
+
+def _insert_statement(db, table, mode):
+    if mode != 'upsert':
+        return insert(table)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise click.ClickException(f'Upsert is not supported on {dialect}')
+    statement = dialect_insert(table)
+    updates = {column.name: statement.excluded[column.name]
+               for column in table.columns if not column.primary_key}
+    return statement.on_conflict_do_update(index_elements=[c.name for c in table.primary_key.columns],
+                                           set_=updates)
+
+
+def import_rows(db, table, rows, mode='insert', chunk_size=5000):
+    """Bulk insert (or upsert) an iterable of dicts, one transaction per chunk.
+
+    Returns the number of rows written.
+    """
+    statement = _insert_statement(db, table, mode)
+    rows = iter(rows)
+    total = 0
+    while True:
+        chunk = [_coerce(table, row) for row in islice(rows, chunk_size)]
+        if not chunk:
+            break
+        # executemany needs the same keys in every row of a batch
+        groups = {}
+        for row in chunk:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        with db.engine.begin() as connection:
+            for group in groups.values():
+                connection.execute(statement, group)
+        total += len(chunk)
+    if total:
+        _reset_sequence(db, table)
+    return total
+
+
+def _reset_sequence(db, table):
+    """Move a PostgreSQL id sequence past the imported ids, so the next ORM insert
+    does not reuse one of them. Other databases take MAX(id) + 1 by themselves."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for column in table.primary_key.columns:
+        if not isinstance(column.type, Integer) or column.autoincrement is False:
+            continue
+        with db.engine.begin() as connection:
+            top = connection.execute(select(func.max(column))).scalar()
+            connection.execute(
+                text('SELECT setval(pg_get_serial_sequence(:table, :column), :value, :called)'),
+                {'table': table.name, 'column': column.name, 'value': top or 1, 'called': top is not None}
+            )
+
+
+def create_content_cli(db, models, after_import=None):
+    """Build the 'flask content' command group.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        models (list): content models that can be exported and imported
+        after_import (callable): called with the model after an import, to
+            refresh data that bulk statements bypass (search index, caches...)
+    """
+    tables = {model.__tablename__: model for model in models}
+    names = click.Choice(sorted(tables) + ['all'])
+    content_cli = AppGroup('content', help='Bulk import and export of site content.')
+
+    @content_cli.command('export')
+    @click.argument('name', type=names)
+    @click.option('-o', '--output', default='-', help="File (or directory for 'all'); '-' for stdout.")
+    @click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None,
+                  help='Defaults to the output file extension, then jsonl.')
+    def export_command(name, output, fmt):
+        """Export a content table as JSONL or CSV."""
+        if name == 'all':
+            if output == '-':
+                raise click.UsageError("Exporting 'all' needs an output directory")
+            fmt = fmt or 'jsonl'
+            os.makedirs(output, exist_ok=True)
+            targets = [(tables[table], os.path.join(output, f'{table}.{fmt}')) for table in sorted(tables)]
+        else:
+            targets = [(tables[name], output)]
+
+        for model, path in targets:
+            out = _open_output(path)
+            try:
+                count = export_table(db, model.__table__, out, _detect_format(path, fmt))
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            click.echo(f'{model.__tablename__}: {count} rows exported', err=True)
+
+    @content_cli.command('import')
+    @click.argument('name', type=names)
+    @click.argument('path', type=click.Path(exists=True))
+    @click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None,
+                  help='Defaults to the file extension.')
+    @click.option('--mode', type=click.Choice(['insert', 'upsert']), default='insert',
+                  help='upsert replaces rows whose id already exists.')
+    @click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+    def import_command(name, path, fmt, mode, chunk_size):
+        """Import a content table from JSONL or CSV (a directory for 'all')."""
+        if name == 'all':
+            if not os.path.isdir(path):
+                raise click.UsageError("Importing 'all' needs a directory of exported files")
+            sources = []
+            for table in sorted(tables):
+                for ext in ('jsonl', 'csv'):
+                    file_path = os.path.join(path, f'{table}.{ext}')
+                    if os.path.exists(file_path):
+                        sources.append((tables[table], file_path))
+                        break
+        else:
+            sources = [(tables[name], path)]
+
+        for model, file_path in sources:
+            rows = _read_rows(file_path, _detect_format(file_path, fmt))
+            count = import_rows(db, model.__table__, rows, mode=mode, chunk_size=chunk_size)
+            if after_import:
+                after_import(model)
+            click.echo(f'{model.__tablename__}: {count} rows imported', err=True)
+
+    return content_cli
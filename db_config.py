@@ -0,0 +1,73 @@
+"""
+Database engine configuration from the environment.
+
+    DATABASE_URL            SQLAlchemy URL (default sqlite:///gym.db)
+    DB_POOL_SIZE            connections kept open per process (server DBs, default 5)
+    DB_MAX_OVERFLOW         extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING        check connections before use, 1/0 (default 1)
+    SQLITE_JOURNAL_MODE     default WAL, so readers do not block the writer
+    SQLITE_SYNCHRONOUS      default NORMAL (safe with WAL, far fewer fsyncs)
+    SQLITE_MMAP_SIZE        bytes of the file read through mmap (default 256 MB)
+    SQLITE_CACHE_SIZE       page cache, negative values are KiB (default -65536 = 64 MB)
+    SQLITE_BUSY_TIMEOUT     ms to wait for a lock instead of failing (default 5000)
+
+The same code then runs on a single box with SQLite or against a server
+database with a connection pool, without edits.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def database_url():
+    url = os.getenv('DATABASE_URL') or 'sqlite:///gym.db'
+    # Some hosts still hand out the old postgres:// scheme, which SQLAlchemy 2 rejects
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for this database URL"""
+    if make_url(url).get_backend_name() == 'sqlite':
+        # sqlite3's own lock wait, in seconds; the pragma below covers reconnects too
+        return {'connect_args': {'timeout': _env_int('SQLITE_BUSY_TIMEOUT', 5000) / 1000}}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False'),
+    }
+
+
+def sqlite_pragmas():
+    return [
+        ('journal_mode', os.getenv('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('cache_size', _env_int('SQLITE_CACHE_SIZE', -65536)),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT', 5000)),
+    ]
+
+
+def configure_engine(engine):
+    """Apply the SQLite pragmas to every new connection of an engine (no-op for other databases)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
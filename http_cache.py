@@ -0,0 +1,112 @@
+"""
+Conditional GET support (ETag / Last-Modified / 304 Not Modified).
+
+Every flush that inserts, updates or deletes rows of a tracked table bumps a
+per-table row in the change_stamps table, inside the same transaction.
+Validators for a response are computed from the stamps of the tables it is
+built from, so checking them costs one small indexed query and the view is
+only run when something actually changed. A build id (templates and static
+assets of the running deploy) is folded into every validator as well, so a
+deploy that changes the markup is never answered with a stale 304.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, request, session
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+
+class ChangeStamps:
+    """Per-table change counters and the conditional-GET decorator built on them.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        model: model mapped to the change_stamps table
+        tables (iterable): names of the tables to track
+        build_id (str): version of the deployed templates and assets
+        built_at (datetime): when that build was made (UTC), used as the
+            earliest Last-Modified
+    """
+
+    def __init__(self, db, model, tables, build_id='', built_at=None):
+        self.db = db
+        self.model = model
+        self.tables = set(tables)
+        self.build_id = build_id
+        self.built_at = built_at
+        event.listen(Session, 'after_flush', self._after_flush)
+
+    def _after_flush(self, session, flush_context):
+        changed = {obj.__table__.name
+                   for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+                   if getattr(obj, '__table__', None) is not None}
+        changed &= self.tables
+        if changed:
+            self.touch(session.connection(), *changed)
+
+    def touch(self, connection, *tables):
+        """Record a change to these tables (use after bulk Core statements)."""
+        now = datetime.utcnow()
+        for table in tables:
+            connection.execute(text(
+                'INSERT INTO change_stamps (table_name, version, changed_at) VALUES (:table, 1, :now) '
+                'ON CONFLICT (table_name) DO UPDATE SET version = change_stamps.version + 1, changed_at = :now'
+            ), {'table': table, 'now': now})
+
+    def get(self, tables):
+        """Return ({table: version}, last change time or None) for these tables."""
+        rows = self.db.session.execute(
+            select(self.model.table_name, self.model.version, self.model.changed_at)
+            .where(self.model.table_name.in_(tables))
+        ).all()
+        versions = {table: 0 for table in tables}
+        last_modified = None
+        for table, version, changed_at in rows:
+            versions[table] = version
+            if changed_at and (last_modified is None or changed_at > last_modified):
+                last_modified = changed_at
+        return versions, last_modified
+
+    def conditional(self, *tables, cache_control='public, no-cache', anonymous_only=True):
+        """Answer GET requests with 304 when the tables have not changed.
+
+        Args:
+            tables: tables the response is built from
+            cache_control (str): Cache-Control header for this route
+            anonymous_only (bool): skip validation for logged-in admins, whose
+                pages differ from the public ones
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or session.get('_flashes') \
+                        or (anonymous_only and request.cookies.get('admin_logged_in')):
+                    return view(*args, **kwargs)
+
+                versions, last_modified = self.get(tables)
+                fingerprint = request.full_path + '|' + self.build_id + '|' + \
+                    ','.join(f'{t}={versions[t]}' for t in sorted(versions))
+                etag = hashlib.sha1(fingerprint.encode()).hexdigest()[:20]
+                if self.built_at is not None and (last_modified is None or self.built_at > last_modified):
+                    last_modified = self.built_at
+                if last_modified is not None:
+                    last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+                if request.if_none_match.contains_weak(etag) or (
+                        not request.if_none_match and last_modified is not None
+                        and request.if_modified_since and request.if_modified_since >= last_modified):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.headers['Cache-Control'] = cache_control
+                return response
+            return wrapper
+        return decorator
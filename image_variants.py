@@ -0,0 +1,98 @@
+"""
+Responsive variants of uploaded images.
+
+Every uploaded image is resized to a few widths and saved as WebP and JPEG
+next to the original (images/variants/<name>-<width>.<ext>). The list is
+stored on the Media row, and the responsive_image() template helper turns
+it into a <picture> element with srcset, so browsers download the smallest
+file that fits the layout instead of the full-size original.
+"""
+
+import os
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps
+
+WIDTHS = (320, 640, 1024, 1600)
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def _flatten(image):
+    """RGB copy of an image with transparency composited on white (for JPEG)."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(source_path, output_dir, url_prefix, widths=WIDTHS):
+    """Write the resized variants of one image.
+
+    Args:
+        source_path (str): original image file
+        output_dir (str): directory for the variant files
+        url_prefix (str): public URL of output_dir
+        widths (tuple): target widths; widths larger than the original are skipped
+
+    Returns:
+        dict: {'webp': [{'width', 'url'}...], 'jpeg': [...]} smallest first,
+            or None if the file is not a still image Pillow can read
+    """
+    try:
+        image = Image.open(source_path)
+        if getattr(image, 'is_animated', False):
+            return None  # resizing would drop the animation
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    targets = [w for w in widths if w < image.width] or [image.width]
+
+    variants = {name: [] for name in FORMATS}
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for name, options in FORMATS.items():
+            filename = f'{stem}-{width}.{EXTENSIONS[name]}'
+            if name == 'jpeg':
+                frame = _flatten(resized)
+            else:
+                has_alpha = resized.mode in ('RGBA', 'LA', 'PA') or 'transparency' in resized.info
+                frame = resized.convert('RGBA' if has_alpha else 'RGB')
+            frame.save(os.path.join(output_dir, filename), **options)
+            variants[name].append({'width': width, 'url': f'{url_prefix}/{filename}'})
+    return variants
+
+
+def variant_paths(variants, static_folder):
+    """Filesystem paths of every variant file, for deletion."""
+    paths = []
+    for entries in (variants or {}).values():
+        for entry in entries:
+            paths.append(os.path.join(static_folder, entry['url'].replace('/static/', '', 1)))
+    return paths
+
+
+def srcset(entries):
+    return ', '.join(f"{entry['url']} {entry['width']}w" for entry in entries)
+
+
+def picture_tag(url, variants, alt='', sizes='100vw', **attrs):
+    """<picture> markup for an image and its variants (a plain <img> if there are none)."""
+    extra = ''.join(f' {escape(name.rstrip("_").replace("_", "-"))}="{escape(value)}"' for name, value in attrs.items())
+    img = f'<img src="{escape(url)}" alt="{escape(alt)}" loading="lazy" decoding="async"{extra}'
+    if not variants:
+        return Markup(img + '>')
+    sources = ''
+    if variants.get('webp'):
+        sources = f'<source type="image/webp" srcset="{escape(srcset(variants["webp"]))}" sizes="{escape(sizes)}">'
+    if variants.get('jpeg'):
+        img += f' srcset="{escape(srcset(variants["jpeg"]))}" sizes="{escape(sizes)}"'
+    return Markup(f'<picture>{sources}{img}></picture>')
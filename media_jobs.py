@@ -0,0 +1,116 @@
+"""
+Background processing of uploaded media on a process pool.
+
+Upload requests only write the raw file and its Media row (status
+'pending') and enqueue a job. Hashing, metadata extraction and image variants
+then run on spare cores. When the job finishes, the result is applied to the
+row in the web process, and its status becomes 'ready', or 'failed'.
+
+Jobs are submitted once the upload's transaction commits, so a worker never
+sees a row that was rolled back. MEDIA_WORKERS sets the pool size; 0 runs
+the jobs inline, which is what CLI commands and tests want.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import event
+from PIL import Image
+from image_variants import generate_variants
+
+
+def process_media(job):
+    """Work done for one file, in a worker process (no database access here).
+
+    Args:
+        job (dict): path, filetype, and variant_dir / variant_url for images;
+            sha256 when the upload was already hashed while streaming
+
+    Returns:
+        dict: filesize, sha256, width, height and variants
+    """
+    path = job['path']
+    result = {'filesize': os.path.getsize(path), 'sha256': job.get('sha256'),
+              'width': None, 'height': None, 'variants': None}
+
+    if not result['sha256']:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        result['sha256'] = sha.hexdigest()
+
+    if job['filetype'] == 'image':
+        try:
+            with Image.open(path) as image:
+                result['width'], result['height'] = image.size
+        except (OSError, SyntaxError, ValueError):
+            pass
+        result['variants'] = generate_variants(path, job['variant_dir'], job['variant_url'])
+    return result
+
+
+class MediaJobs:
+    """Process pool plus the glue that submits jobs after commit.
+
+    Args:
+        app: Flask application (results are applied inside its app context)
+        db: Flask-SQLAlchemy instance
+        apply_result (callable): apply_result(media_id, result, error) run in
+            the web process when a job ends; error is None on success
+        workers (int): pool size, 0 to run jobs inline
+    """
+
+    def __init__(self, app, db, apply_result, workers=None):
+        self.app = app
+        self.db = db
+        self.apply_result = apply_result
+        self.workers = max(1, (os.cpu_count() or 2) - 1) if workers is None else workers
+        self._executor = None
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def enqueue(self, media_id, job):
+        """Queue a job for a Media row; it starts when the current transaction commits."""
+        self.db.session.info.setdefault('media_jobs', []).append((media_id, job))
+
+    def _after_commit(self, session):
+        for media_id, job in session.info.pop('media_jobs', []):
+            self.submit(media_id, job)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop('media_jobs', None)
+
+    def submit(self, media_id, job):
+        if not self.workers:
+            self.run(media_id, job)
+            return
+        future = self.executor.submit(process_media, job)
+        future.add_done_callback(lambda done: self._finish(media_id, done))
+
+    def run(self, media_id, job):
+        """Process a job in this process and apply its result."""
+        try:
+            result, error = process_media(job), None
+        except Exception as e:
+            result, error = None, e
+        self._apply(media_id, result, error)
+
+    def _finish(self, media_id, future):
+        error = future.exception()
+        self._apply(media_id, None if error else future.result(), error)
+
+    def _apply(self, media_id, result, error):
+        with self.app.app_context():
+            try:
+                self.apply_result(media_id, result, error)
+            except Exception:
+                self.db.session.rollback()
+                self.app.logger.exception('Could not apply media job result for %s', media_id)
@@ -0,0 +1,118 @@
+"""
+Reconciliation of the upload folders with the media table.
+
+The upload tree is listed with os.scandir, one directory per task on a
+thread pool (directory listing is I/O bound, so threads overlap the
+syscalls), and compared with the paths the database knows about, read in a
+single query. The result lists orphaned files (on disk, not referenced) and
+dangling rows (Media rows whose file is missing).
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from sqlalchemy import literal, select, union_all
+
+# Temporary files of uploads still being written are left alone for this long
+TEMP_GRACE_SECONDS = 3600
+
+
+def _list_dir(path):
+    files, subdirs = {}, []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files[entry.path] = (stat.st_size, stat.st_mtime)
+    return files, subdirs
+
+
+def scan_tree(root, workers=16):
+    """{absolute path: (size, mtime)} of every file below root."""
+    files = {}
+    if not os.path.isdir(root):
+        return files
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_list_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                files.update(found)
+                pending.update(pool.submit(_list_dir, subdir) for subdir in subdirs)
+    return files
+
+
+def referenced_urls(db, media_model, url_columns):
+    """Media rows and the upload URLs the database points at.
+
+    Returns:
+        tuple: ({media id: (url, variants)}, set of URLs used by content rows)
+    """
+    statement = union_all(
+        select(media_model.id, media_model.filepath, media_model.variants),
+        *[select(literal(None), column, literal(None)).where(column.like('/static/uploads/%'))
+          for column in url_columns]
+    )
+    # Soft-deleted content can be restored, so its files still count as used
+    statement = statement.execution_options(include_deleted=True)
+    media, content_urls = {}, set()
+    for media_id, url, variants in db.session.execute(statement):
+        if media_id is None:
+            content_urls.add(url)
+        else:
+            media[media_id] = (url, variants)
+    return media, content_urls
+
+
+def reconcile(db, media_model, url_columns, static_folder, upload_folder, workers=16):
+    """Compare the upload tree with the database.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        media_model: the Media model
+        url_columns (list): content columns that may hold upload URLs
+        static_folder (str): directory served as /static
+        upload_folder (str): root of the upload tree
+        workers (int): threads listing directories
+
+    Returns:
+        dict: 'orphans' [(path, size)], 'dangling' [media ids], 'files' and 'rows' totals
+    """
+    def to_path(url):
+        return os.path.normpath(os.path.join(static_folder, url.replace('/static/', '', 1)))
+
+    files = scan_tree(upload_folder, workers)
+    media, content_urls = referenced_urls(db, media_model, url_columns)
+
+    expected = {to_path(url) for url in content_urls}
+    dangling = []
+    for media_id, (url, variants) in media.items():
+        path = to_path(url)
+        expected.add(path)
+        if path not in files:
+            dangling.append(media_id)
+        for entries in (variants or {}).values():
+            expected.update(to_path(entry['url']) for entry in entries)
+
+    now = time.time()
+    orphans = [(path, size) for path, (size, mtime) in files.items()
+               if path not in expected
+               and not (path.endswith('.upload') and now - mtime < TEMP_GRACE_SECONDS)]
+    return {'orphans': sorted(orphans), 'dangling': sorted(dangling),
+            'files': len(files), 'rows': len(media)}
+
+
+def remove_files(paths, workers=16):
+    """Delete files in parallel. Returns the number removed."""
+    def remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(remove, paths))
@@ -0,0 +1,120 @@
+"""
+Full-page response cache for anonymous GET requests.
+
+Rendered pages are stored in a cache backend (see cache_backend.py) together
+with the version of every tag they depend on, e.g. 'exercises:home' for a
+category listing or 'exercises:12' for a detail page. Invalidating a tag
+stores a new version, so every page built from the old one becomes a miss,
+on every worker sharing the backend. Keys also carry the build id of the
+deploy, so pages rendered with older templates are not served after a deploy.
+
+With a per-process backend (CACHE_BACKEND=memory) a tag invalidation only
+reaches the worker that made it. Entries therefore also record the database
+change stamps of the tables their tags name (the part before ':'), and a hit
+is only served while those are unchanged, which every worker sees. The
+hit/miss counters are per process.
+"""
+
+import time
+from functools import wraps
+from flask import g, make_response, request, session, current_app
+
+
+class PageCache:
+    """Tag-invalidated page cache.
+
+    Args:
+        cache: backend from cache_backend.create_cache
+        ttl (int): seconds a rendered page is kept at most
+        build_id (str): version of the deployed templates and assets
+        stamps (callable): stamps(tables) -> {table: version} from the
+            database, checked on every hit; None to rely on tags only
+    """
+
+    def __init__(self, cache, ttl=3600, build_id='', stamps=None):
+        self.cache = cache
+        self.ttl = ttl
+        self.build_id = build_id
+        self.stamps = stamps
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, tag):
+        return self.cache.get(f'tag:{tag}') or 0
+
+    def invalidate(self, *tags):
+        """Mark every page depending on one of these tags as stale."""
+        version = time.time_ns()
+        for tag in tags:
+            self.cache.set(f'tag:{tag}', version)
+
+    def add_tags(self, *tags):
+        """Add tags from inside a view, once the data it depends on is known."""
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+    def _stamps(self, tags):
+        if self.stamps is None:
+            return {}
+        return self.stamps(sorted({tag.split(':')[0] for tag in tags}))
+
+    def _stamps_unchanged(self, stamps):
+        return self.stamps is None or not stamps or self.stamps(sorted(stamps)) == stamps
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0
+        }
+
+    @staticmethod
+    def _cacheable_request():
+        return (request.method == 'GET'
+                and not request.cookies.get('admin_logged_in')
+                and not session.get('_flashes'))
+
+    def cached(self, *tags):
+        """Cache the decorated view for anonymous visitors.
+
+        Tags may use the view arguments, e.g. 'exercises:{category}'.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable_request():
+                    return view(*args, **kwargs)
+
+                key = f"page:{self.build_id}:{request.path}?{'&'.join(sorted(request.query_string.decode().split('&')))}"
+                entry = self.cache.get(key)
+                if entry is not None and all(self._version(tag) == version
+                                             for tag, version in entry['tags'].items()) \
+                        and self._stamps_unchanged(entry.get('stamps', {})):
+                    self.hits += 1
+                    response = current_app.response_class(entry['body'], status=entry['status'],
+                                                          mimetype=entry['mimetype'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses += 1
+                page_tags = {tag.format(**kwargs) for tag in tags}
+                # Read tag versions before rendering so an invalidation during rendering is not lost
+                versions = {tag: self._version(tag) for tag in page_tags}
+                stamps = self._stamps(page_tags)
+                response = make_response(view(*args, **kwargs))
+
+                extra_tags = g.pop('page_cache_tags', set()) - page_tags
+                versions.update({tag: self._version(tag) for tag in extra_tags})
+                if response.status_code == 200 and not response.direct_passthrough \
+                        and self._cacheable_request():
+                    self.cache.set(key, {
+                        'body': response.get_data(as_text=True),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype,
+                        'tags': versions,
+                        'stamps': stamps
+                    }, ttl=self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,71 @@
+"""
+Per-request SQL query counter and N+1 detector.
+
+Every statement run while handling a request is counted and timed through
+the engine's cursor events. The totals are sent back in the X-Query-Count
+and X-Query-Time (milliseconds) headers and logged, and a statement that
+runs repeat_threshold times or more in one request - the usual shape of an
+N+1 pattern, e.g. a lazy load inside a template loop - is logged as a
+warning with its repeat count.
+
+Enabled with QUERY_STATS=1 (or FLASK_DEBUG=1) in the environment.
+"""
+
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+class QueryStats:
+    """Counts the queries of each request.
+
+    Args:
+        app: Flask application
+        engine: SQLAlchemy engine to watch
+        repeat_threshold (int): executions of the same statement reported as a possible N+1
+    """
+
+    def __init__(self, app, engine, repeat_threshold=3):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _stats(self):
+        if has_request_context():
+            return g.get('query_stats')
+        return None
+
+    def _start(self):
+        g.query_stats = {'count': 0, 'time': 0.0, 'statements': Counter()}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._stats() is not None:
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._stats()
+        if stats is None or not conn.info.get('query_start'):
+            return
+        stats['time'] += time.perf_counter() - conn.info['query_start'].pop()
+        stats['count'] += 1
+        stats['statements'][statement] += 1
+
+    def _finish(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        elapsed = round(stats['time'] * 1000, 2)
+        response.headers['X-Query-Count'] = str(stats['count'])
+        response.headers['X-Query-Time'] = str(elapsed)
+        self.app.logger.info('%s %s: %d queries in %.2f ms',
+                             request.method, request.path, stats['count'], elapsed)
+        for statement, count in stats['statements'].most_common():
+            if count < self.repeat_threshold:
+                break
+            self.app.logger.warning('Possible N+1 on %s %s: statement run %d times: %s',
+                                    request.method, request.path, count, ' '.join(statement.split())[:300])
+        return response
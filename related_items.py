@@ -0,0 +1,212 @@
+"""
+Precomputed "related items" for the detail pages.
+
+For every exercise, nutrition item, program and article the closest items of
+the same category are stored in the related_items table, ranked by text
+similarity of their titles and bodies. Detail pages read those rows through
+the primary key instead of picking arbitrary items on every view, and the
+rows are recomputed incrementally when an admin changes one item, on a
+background thread so saving never waits for it. Items sharing no word are not
+related: an item with nothing similar in its category gets a single marker
+row (related_id 0), so the page knows it was computed and does not fall back
+to another query.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import and_, delete, func, insert, select
+from search_index import normalize_arabic
+
+_WORD = re.compile(r'\w{3,}')
+
+# related_id of the row stored for an item that has no neighbours
+NO_NEIGHBOURS = 0
+
+# Attached article/prepositions stripped from Arabic words (longest first)
+_PREFIXES = ('وبال', 'وال', 'بال', 'كال', 'فال', 'لل', 'ال', 'و')
+
+
+def _stem(word):
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            return word[len(prefix):]
+    return word
+
+
+def _tokens(value):
+    return {_stem(word) for word in _WORD.findall(normalize_arabic(value))}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class RelatedItems:
+    """Maintains the related_items table.
+
+    Args:
+        app: Flask application (background jobs run inside its app context)
+        db: Flask-SQLAlchemy instance
+        model: model mapped to the related_items table
+        sources (dict): table name -> (model, title attribute, body attribute)
+        top_n (int): neighbours stored per item
+        workers (int): 1 to recompute on a background thread, 0 to run inline
+            (CLI, tests); one thread keeps the updates in order
+        on_change (callable): on_change(content_model, item_ids) after new rows
+            are committed, to drop cached pages; item_ids is None after a rebuild
+    """
+
+    def __init__(self, app, db, model, sources, top_n=3, workers=1, on_change=None):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.sources = sources
+        self.top_n = top_n
+        self.workers = workers
+        self.on_change = on_change
+        self._executor = None
+
+    def schedule(self, func, *args):
+        """Run func(*args) in the background (inline when workers is 0), inside an app context."""
+        if not self.workers:
+            self._run(func, *args)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        with self.app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                self.db.session.rollback()
+                self.app.logger.exception('Related items job %s%s failed', func.__name__, args)
+
+    def _profiles(self, content_model, category):
+        """Token sets for every item of a category: {id: (title tokens, all tokens)}"""
+        _, title_attr, body_attr = self.sources[content_model.__tablename__]
+        rows = self.db.session.execute(
+            select(content_model.id, getattr(content_model, title_attr), getattr(content_model, body_attr))
+            .where(content_model.category == category)
+        ).all()
+        profiles = {}
+        for item_id, title, body in rows:
+            title_tokens = _tokens(title)
+            profiles[item_id] = (title_tokens, title_tokens | _tokens(body))
+        return profiles
+
+    @staticmethod
+    def _score(a, b):
+        return round(0.3 * _jaccard(a[0], b[0]) + 0.7 * _jaccard(a[1], b[1]), 4)
+
+    def _neighbours(self, item_id, profiles):
+        profile = profiles[item_id]
+        scored = [(score, other_id) for score, other_id in
+                  ((self._score(profile, other), other_id)
+                   for other_id, other in profiles.items() if other_id != item_id)
+                  if score > 0]
+        # Best score first; newer items (higher id) win ties
+        scored.sort(key=lambda pair: (-pair[0], -pair[1]))
+        return scored[:self.top_n]
+
+    def _store(self, kind, item_id, neighbours):
+        session = self.db.session
+        session.execute(delete(self.model).where(self.model.kind == kind, self.model.item_id == item_id))
+        session.execute(insert(self.model), [
+            {'kind': kind, 'item_id': item_id, 'rank': rank, 'related_id': related_id, 'score': score}
+            for rank, (score, related_id) in enumerate(neighbours or [(None, NO_NEIGHBOURS)])
+        ])
+
+    def update(self, content_model, item_id):
+        """Refresh the rows affected by a change to one item (create, edit or delete)."""
+        kind = content_model.__tablename__
+        if kind not in self.sources:
+            return
+        session = self.db.session
+        item = session.get(content_model, item_id)
+        if getattr(item, 'deleted_at', None) is not None:
+            item = None  # a soft-deleted item counts as gone
+
+        # Items that currently list this one must be recomputed (it may have moved or gone)
+        pointing = set(session.execute(
+            select(self.model.item_id).where(self.model.kind == kind, self.model.related_id == item_id)
+        ).scalars())
+
+        session.execute(delete(self.model).where(self.model.kind == kind, self.model.item_id == item_id))
+        changed = {item_id}
+
+        if item is not None and item.category:
+            profiles = self._profiles(content_model, item.category)
+            self._store(kind, item_id, self._neighbours(item_id, profiles))
+
+            # Other items of the category only change if they list this item, or if it is
+            # similar to them at all and fills a free slot or beats their worst neighbour
+            current = dict((row.item_id, (row.count, row.worst)) for row in session.execute(
+                select(self.model.item_id, func.count().label('count'), func.min(self.model.score).label('worst'))
+                .where(self.model.kind == kind, self.model.item_id.in_(list(profiles)),
+                       self.model.related_id != NO_NEIGHBOURS)
+                .group_by(self.model.item_id)
+            ))
+            for other_id, other in profiles.items():
+                if other_id == item_id:
+                    continue
+                count, worst = current.get(other_id, (0, 0.0))
+                score = self._score(other, profiles[item_id])
+                if other_id in pointing or (score > 0 and (count < self.top_n or score > worst)):
+                    self._store(kind, other_id, self._neighbours(other_id, profiles))
+                    changed.add(other_id)
+                pointing.discard(other_id)
+
+        # Items left over belong to another category (old one after a move, or a deleted item's)
+        by_category = {}
+        for other_id, category in session.execute(
+                select(content_model.id, content_model.category).where(content_model.id.in_(list(pointing)))):
+            by_category.setdefault(category, []).append(other_id)
+        for category, ids in by_category.items():
+            profiles = self._profiles(content_model, category)
+            for other_id in ids:
+                self._store(kind, other_id, self._neighbours(other_id, profiles))
+                changed.add(other_id)
+
+        session.commit()
+        if self.on_change:
+            self.on_change(content_model, changed)
+
+    def rebuild(self, content_model=None):
+        """Recompute every row, for one content model or all of them."""
+        models = [content_model] if content_model else [source[0] for source in self.sources.values()]
+        session = self.db.session
+        for model in models:
+            kind = model.__tablename__
+            session.execute(delete(self.model).where(self.model.kind == kind))
+            categories = session.execute(select(model.category).where(model.category.isnot(None)).distinct())
+            for category in categories.scalars().all():
+                profiles = self._profiles(model, category)
+                for item_id in profiles:
+                    self._store(kind, item_id, self._neighbours(item_id, profiles))
+        session.commit()
+        if self.on_change:
+            for model in models:
+                self.on_change(model, None)
+
+    def query(self, content_model, item_id):
+        """Query of (rank, item) for the stored rows of an item, best first.
+
+        item is None on the marker row, and for neighbours deleted since.
+        """
+        return self.db.session.query(self.model.rank, content_model).outerjoin(content_model, and_(
+            self.model.related_id == content_model.id,
+            self.model.related_id != NO_NEIGHBOURS
+        )).filter(
+            self.model.kind == content_model.__tablename__, self.model.item_id == item_id
+        ).order_by(self.model.rank)
+
+    def neighbours(self, content_model, item_id):
+        """Stored neighbours of an item, best first; None if they were never computed."""
+        rows = self.query(content_model, item_id).all()
+        if not rows:
+            return None
+        return [item for _, item in rows if item is not None]
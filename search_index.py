@@ -0,0 +1,198 @@
+"""
+Full-text search index for the public site search.
+
+Content rows are copied into a SQLite FTS5 table by SQLAlchemy mapper events,
+after Arabic normalisation, and searched with BM25 ranking. Each indexed row
+uses a rowid derived from (kind, item id), so updates and deletes touch a
+single row instead of scanning the index.
+"""
+
+import re
+from sqlalchemy import Integer, event, select, text
+
+# Tashkeel, Quranic annotation marks and tatweel
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+
+# Letters with several common spellings are folded to a single form
+_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',  # alef with hamza/madda/wasla -> alef
+    'ى': 'ي', 'ئ': 'ي',                      # alef maqsura, yeh with hamza -> yeh
+    'ؤ': 'و',                                # waw with hamza -> waw
+    'ة': 'ه',                                # taa marbuta -> heh
+})
+
+# kind -> (model, title attribute, body attribute, rowid code)
+_sources = {}
+
+_ready = False
+
+
+def normalize_arabic(value):
+    """Normalise Arabic text so spellings differing in hamza, taa marbuta,
+    alef maqsura or diacritics compare equal."""
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value)
+    return value.translate(_LETTER_MAP).lower()
+
+
+def _rowid(kind, item_id):
+    return item_id * 8 + _sources[kind][3]
+
+
+def _match_expression(query):
+    """Every word must match, the last one also as a prefix."""
+    terms = [term.replace('"', '""') for term in normalize_arabic(query).split()]
+    if not terms:
+        return ''
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+
+def ensure_search_index(connection):
+    """Create the FTS5 table if needed, indexing existing content on creation.
+
+    Kinds registered after the index was built (e.g. media) have no rows in
+    it yet; they are indexed the first time this runs in a process.
+    """
+    global _ready
+    if _ready or connection.dialect.name != 'sqlite':
+        return
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_index'"
+    )).first() is not None
+    if not exists:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "kind UNINDEXED, item_id UNINDEXED, title, body, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        _ready = True
+        rebuild_search_index(connection)
+        return
+    _ready = True
+    missing = [model for kind, (model, _, _, _) in _sources.items()
+               if connection.execute(text('SELECT 1 FROM search_index WHERE kind = :kind LIMIT 1'),
+                                     {'kind': kind}).first() is None
+               and connection.execute(select(model.id).limit(1)).first() is not None]
+    if missing:
+        rebuild_search_index(connection, missing)
+
+
+def index_item(connection, kind, item_id, title, body):
+    """Insert or replace one item in the index."""
+    rowid = _rowid(kind, item_id)
+    connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': rowid})
+    connection.execute(
+        text('INSERT INTO search_index (rowid, kind, item_id, title, body) '
+             'VALUES (:rowid, :kind, :item_id, :title, :body)'),
+        {'rowid': rowid, 'kind': kind, 'item_id': item_id,
+         'title': normalize_arabic(title), 'body': normalize_arabic(body)}
+    )
+
+
+def remove_item(connection, kind, item_id):
+    connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': _rowid(kind, item_id)})
+
+
+def rebuild_search_index(connection, models=None):
+    """Re-index registered models from scratch (all of them by default).
+
+    Each kind is copied with a single INSERT ... SELECT; the Arabic
+    normalisation runs inside SQLite as a registered function.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    ensure_search_index(connection)
+    connection.connection.driver_connection.create_function(
+        'normalize_arabic', 1, normalize_arabic, deterministic=True)
+    for kind, (model, title_attr, body_attr, code) in _sources.items():
+        if models is not None and model not in models:
+            continue
+        connection.execute(text('DELETE FROM search_index WHERE kind = :kind'), {'kind': kind})
+        table = model.__table__
+        where = ' WHERE deleted_at IS NULL' if hasattr(model, 'deleted_at') else ''
+        connection.execute(text(
+            f'INSERT INTO search_index (rowid, kind, item_id, title, body) '
+            f'SELECT id * 8 + {code}, :kind, id, normalize_arabic({table.c[title_attr].name}), '
+            f'normalize_arabic({table.c[body_attr].name}) FROM {table.name}{where}'
+        ), {'kind': kind})
+
+
+def search(connection, query, kinds=None, page=1, per_page=20):
+    """Search the index.
+
+    Args:
+        connection: SQLAlchemy connection
+        query (str): Text typed by the user
+        kinds (list): Restrict results to these kinds (default: all)
+        page (int): 1-based page number
+        per_page (int): Results per page
+
+    Returns:
+        tuple: (total matches, [(kind, item_id), ...] ordered by BM25 rank)
+    """
+    ensure_search_index(connection)
+    match = _match_expression(query)
+    if not match:
+        return 0, []
+
+    params = {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page}
+    kind_filter = ''
+    if kinds:
+        names = [f':kind{i}' for i in range(len(kinds))]
+        kind_filter = f" AND kind IN ({', '.join(names)})"
+        params.update({f'kind{i}': kind for i, kind in enumerate(kinds)})
+
+    total = connection.execute(
+        text('SELECT COUNT(*) FROM search_index WHERE search_index MATCH :match' + kind_filter), params
+    ).scalar()
+    # Title matches weigh ten times more than body matches
+    rows = connection.execute(
+        text('SELECT kind, item_id FROM search_index WHERE search_index MATCH :match' + kind_filter +
+             ' ORDER BY bm25(search_index, 0, 0, 10.0, 1.0) LIMIT :limit OFFSET :offset'),
+        params
+    ).all()
+    return total, [(kind, int(item_id)) for kind, item_id in rows]
+
+
+def matching_ids(query, kind):
+    """SELECT of the ids of one kind matching query, for an IN filter next to other
+    conditions. None if the query has no searchable words."""
+    match = _match_expression(query)
+    if not match:
+        return None
+    return text('SELECT item_id FROM search_index WHERE search_index MATCH :match AND kind = :kind') \
+        .bindparams(match=match, kind=kind).columns(item_id=Integer)
+
+
+def register(model, kind, title_attr, body_attr, code):
+    """Keep model rows in the index through after_insert/update/delete events.
+
+    Args:
+        model: SQLAlchemy model class
+        kind (str): Name stored in the index for this model
+        title_attr (str): Attribute holding the title (ranked higher)
+        body_attr (str): Attribute holding the body text
+        code (int): Unique number from 1 to 7 used to build index rowids
+    """
+    _sources[kind] = (model, title_attr, body_attr, code)
+
+    def _index(mapper, connection, target):
+        if connection.dialect.name != 'sqlite':
+            return
+        ensure_search_index(connection)
+        if getattr(target, 'deleted_at', None) is not None:
+            # Soft-deleted rows (tombstones) leave the index
+            remove_item(connection, kind, target.id)
+        else:
+            index_item(connection, kind, target.id, getattr(target, title_attr), getattr(target, body_attr))
+
+    def _remove(mapper, connection, target):
+        if connection.dialect.name != 'sqlite':
+            return
+        ensure_search_index(connection)
+        remove_item(connection, kind, target.id)
+
+    event.listen(model, 'after_insert', _index)
+    event.listen(model, 'after_update', _index)
+    event.listen(model, 'after_delete', _remove)
@@ -0,0 +1,178 @@
+"""
+Semantic (embedding) index of content rows in persistent Chroma collections.
+
+Each registered table has its own collection, stored in CHROMA_PATH, with one
+embedding per row computed by a sentence-transformers model.
+after_insert/after_update/after_delete events record which rows changed
+(updates only count when an indexed column changed). When the transaction
+commits, just those rows are re-embedded, on a background thread, so saving
+an item never waits for the model. Soft-deleted rows leave the collection.
+
+`flask reindex-semantic` embeds everything once, e.g. for the first run or
+after changing the model.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, inspect, literal, select
+import chromadb
+from sentence_transformers import SentenceTransformer
+
+BATCH_SIZE = 256
+
+
+class SemanticIndex:
+    """Chroma collections kept in sync with content tables.
+
+    Args:
+        app: Flask application (jobs run inside its app context)
+        db: Flask-SQLAlchemy instance
+        persist_directory (str): where Chroma stores the collections
+        model_name (str): sentence-transformers model used for the embeddings
+        workers (int): background threads, 0 to embed inline (CLI, tests)
+    """
+
+    def __init__(self, app, db, persist_directory, model_name, workers=1):
+        self.app = app
+        self.db = db
+        self.persist_directory = persist_directory
+        self.model_name = model_name
+        self.workers = workers
+        self.sources = {}
+        self._client = None
+        self._embedder = None
+        self._executor = None
+        self._lock = threading.Lock()
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+
+    def register(self, model, *text_attrs, metadata_attrs=('category',)):
+        """Index a model; its document is the text attributes joined by new lines."""
+        table = model.__tablename__
+        self.sources[table] = (model, text_attrs, metadata_attrs)
+        watched = [attr for attr in (*text_attrs, *metadata_attrs, 'deleted_at') if hasattr(model, attr)]
+
+        def _changed(mapper, connection, target):
+            state = inspect(target)
+            state.session.info.setdefault('semantic_index', {}).setdefault(table, set()).add(target.id)
+
+        def _updated(mapper, connection, target):
+            attrs = inspect(target).attrs
+            if any(attrs[attr].history.has_changes() for attr in watched):
+                _changed(mapper, connection, target)
+
+        event.listen(model, 'after_insert', _changed)
+        event.listen(model, 'after_update', _updated)
+        event.listen(model, 'after_delete', _changed)
+
+    # Model and collections are loaded on first use, not when the app imports
+    @property
+    def embedder(self):
+        with self._lock:
+            if self._embedder is None:
+                self._embedder = SentenceTransformer(self.model_name)
+        return self._embedder
+
+    def collection(self, table):
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client.get_or_create_collection(table, metadata={'hnsw:space': 'cosine'})
+
+    def _after_commit(self, session):
+        for table, ids in session.info.pop('semantic_index', {}).items():
+            self.schedule(self.update, table, sorted(ids))
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop('semantic_index', None)
+
+    def schedule(self, func, *args):
+        """Run func(*args) in the background (inline when workers is 0), inside an app context."""
+        if not self.workers:
+            self._run(func, *args)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._executor.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        with self.app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                self.db.session.rollback()
+                self.app.logger.exception('Semantic index job %s%s failed', func.__name__, args)
+
+    def _rows(self, table, *criteria, limit=None):
+        """[(id, soft-deleted, {attr: value})] of the rows matching criteria, by id"""
+        model, text_attrs, metadata_attrs = self.sources[table]
+        attrs = [*text_attrs, *metadata_attrs]
+        deleted_at = getattr(model, 'deleted_at', literal(None))
+        statement = select(model.id, deleted_at, *[getattr(model, attr) for attr in attrs]) \
+            .where(*criteria).order_by(model.id).limit(limit) \
+            .execution_options(include_deleted=True)
+        return [(row[0], row[1] is not None, dict(zip(attrs, row[2:])))
+                for row in self.db.session.execute(statement)]
+
+    def _upsert(self, table, items):
+        """Embed and store [(id, {attr: value})]."""
+        if not items:
+            return
+        _, text_attrs, metadata_attrs = self.sources[table]
+        documents = ['\n'.join(str(values[attr]) for attr in text_attrs if values[attr]) for _, values in items]
+        embeddings = self.embedder.encode(documents, batch_size=64, normalize_embeddings=True)
+        self.collection(table).upsert(
+            ids=[str(item_id) for item_id, _ in items],
+            embeddings=[list(map(float, vector)) for vector in embeddings],
+            documents=documents,
+            # Chroma metadata values cannot be None
+            metadatas=[{attr: '' if values[attr] is None else values[attr] for attr in metadata_attrs}
+                       for _, values in items]
+        )
+
+    def update(self, table, ids):
+        """Re-embed these rows, and drop the ones deleted or soft-deleted."""
+        model = self.sources[table][0]
+        live, gone = [], set(ids)
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            for item_id, deleted, values in self._rows(table, model.id.in_(chunk)):
+                if not deleted:
+                    live.append((item_id, values))
+                    gone.discard(item_id)
+        for start in range(0, len(live), BATCH_SIZE):
+            self._upsert(table, live[start:start + BATCH_SIZE])
+        if gone:
+            self.collection(table).delete(ids=[str(item_id) for item_id in gone])
+
+    def backfill(self, table):
+        """Embed every live row of a table and drop entries of rows that no longer exist.
+
+        Returns the number of rows indexed.
+        """
+        model = self.sources[table][0]
+        indexed = set()
+        last_id = 0
+        while True:
+            rows = self._rows(table, model.id > last_id, limit=BATCH_SIZE)
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            batch = [(item_id, values) for item_id, deleted, values in rows if not deleted]
+            self._upsert(table, batch)
+            indexed.update(str(item_id) for item_id, _ in batch)
+
+        collection = self.collection(table)
+        stale = [item_id for item_id in collection.get(include=[])['ids'] if item_id not in indexed]
+        for start in range(0, len(stale), BATCH_SIZE):
+            collection.delete(ids=stale[start:start + BATCH_SIZE])
+        return len(indexed)
+
+    def search(self, table, query, limit=10, category=None):
+        """Ids of the rows closest in meaning to query, with their cosine distance."""
+        embedding = self.embedder.encode([query], normalize_embeddings=True)[0]
+        result = self.collection(table).query(
+            query_embeddings=[list(map(float, embedding))], n_results=limit,
+            where={'category': category} if category else None, include=['distances']
+        )
+        return [(int(item_id), distance) for item_id, distance in zip(result['ids'][0], result['distances'][0])]
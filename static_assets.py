@@ -0,0 +1,150 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies every file under static/ (uploads excluded) to a
+sibling named after its content hash (css/site.css -> css/site.1a2b3c4d5e6f.css),
+writes a gzip-compressed .gz next to text assets, and records the mapping in
+static/assets-manifest.json. With the manifest present:
+
+- url_for('static', filename='css/site.css') emits the fingerprinted path;
+- fingerprinted files are served with a one-year immutable Cache-Control,
+  and the .gz file is sent as-is to clients that accept gzip, so assets are
+  neither revalidated nor compressed per request.
+
+A changed file gets a new name, so the long cache never serves stale assets.
+Old fingerprinted files are kept for pages still cached with their URLs.
+Nothing changes in debug mode or before the first build.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import request, send_from_directory
+
+MANIFEST = 'assets-manifest.json'
+CACHE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico'}
+_FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+(\.gz)?$')
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class StaticAssets:
+    """Builds the fingerprinted assets and serves them.
+
+    Args:
+        app: Flask application
+        exclude (tuple): top-level folders of static/ that are not assets
+    """
+
+    def __init__(self, app, exclude=('uploads',)):
+        self.app = app
+        self.exclude = set(exclude)
+        self.manifest = {}
+        self.fingerprinted = set()
+        self.load()
+        app.url_defaults(self._url_defaults)
+        app.view_functions['static'] = self.serve
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.app.static_folder, MANIFEST)
+
+    def load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+        self.fingerprinted = set(self.manifest.values())
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static' and not self.app.debug and 'filename' in values:
+            values['filename'] = self.manifest.get(values['filename'], values['filename'])
+
+    def serve(self, filename):
+        if filename not in self.fingerprinted:
+            return self.app.send_static_file(filename)
+        static_folder = self.app.static_folder
+        gzipped = filename + '.gz'
+        if 'gzip' in request.accept_encodings and os.path.isfile(os.path.join(static_folder, gzipped)):
+            response = send_from_directory(static_folder, gzipped, max_age=CACHE_MAX_AGE)
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response.content_encoding = 'gzip'
+        else:
+            response = send_from_directory(static_folder, filename, max_age=CACHE_MAX_AGE)
+        if os.path.splitext(filename)[1] in COMPRESSIBLE:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+        return response
+
+    def _sources(self):
+        root = self.app.static_folder
+        for directory, subdirs, files in os.walk(root):
+            if directory == root:
+                subdirs[:] = [d for d in subdirs if d not in self.exclude]
+            for name in files:
+                if name == MANIFEST or name.endswith('.gz') or _FINGERPRINTED.search(name):
+                    continue
+                yield os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+
+    def _rewrite_css(self, logical, data):
+        """Point url() references of a stylesheet at the fingerprinted files."""
+        base = posixpath.dirname(logical)
+
+        def replace(match):
+            quote, url = match.groups()
+            if url.startswith(('data:', 'http:', 'https:', '//', '#')):
+                return match.group(0)
+            path, sep, suffix = url.partition('?')
+            if not sep:
+                path, sep, suffix = url.partition('#')
+            target = posixpath.normpath(posixpath.join(base, path)).lstrip('/')
+            if path.startswith('/static/'):
+                target = path[len('/static/'):]
+            hashed = self.manifest.get(target)
+            if hashed is None:
+                return match.group(0)
+            new = '/static/' + hashed if path.startswith('/') else posixpath.relpath(hashed, base or '.')
+            return f'url({quote}{new}{sep}{suffix}{quote})'
+
+        return _CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+    def build(self):
+        """Write fingerprinted copies, .gz siblings and the manifest. Returns the number of files."""
+        root = self.app.static_folder
+        sources = sorted(self._sources(), key=lambda name: name.endswith('.css'))
+        manifest = {}
+        self.manifest = manifest
+        for logical in sources:  # stylesheets last, once the files they reference have names
+            with open(os.path.join(root, logical), 'rb') as f:
+                data = f.read()
+            stem, ext = posixpath.splitext(logical)
+            if ext == '.css':
+                data = self._rewrite_css(logical, data)
+            hashed = f'{stem}.{fingerprint(data)}{ext}'
+            target = os.path.join(root, hashed)
+            if not os.path.exists(target):
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(target + '.tmp', target)
+            if ext in COMPRESSIBLE and not os.path.exists(target + '.gz'):
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(compressed) < len(data):
+                    with open(target + '.gz.tmp', 'wb') as f:
+                        f.write(compressed)
+                    os.replace(target + '.gz.tmp', target + '.gz')
+            manifest[logical] = hashed
+
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        self.load()
+        return len(manifest)
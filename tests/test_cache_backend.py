@@ -0,0 +1,55 @@
+"""
+Behaviour shared by every cache backend: JSON round trip, delete and TTL expiry.
+"""
+
+import time
+
+import pytest
+
+from cache_backend import MemoryCache, SQLiteCache, create_cache
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'local-redis'])
+def cache(request, tmp_path):
+    return create_cache(request.param, url=str(tmp_path / 'cache.db'))
+
+
+def test_round_trip(cache):
+    value = [{'role': 'user', 'content': 'مرحبا'}, {'role': 'assistant', 'content': 'أهلاً'}]
+    cache.set('conversation:1', value)
+    assert cache.get('conversation:1') == value
+    assert cache.get('conversation:2') is None
+
+
+def test_delete(cache):
+    cache.set('key', 1)
+    cache.delete('key')
+    assert cache.get('key') is None
+
+
+def test_expired_entries_are_not_returned(cache, monkeypatch):
+    cache.set('key', 'value', ttl=10)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert cache.get('key') is None
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SQLiteCache(path).set('key', {'a': 1})
+    assert SQLiteCache(path).get('key') == {'a': 1}
+
+
+def test_purge_expired(monkeypatch):
+    cache = MemoryCache()
+    cache.set('old', 1, ttl=1)
+    cache.set('kept', 2)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 2)
+    cache.purge_expired()
+    assert cache._data.keys() == {'kept'}
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_cache('memcached')
@@ -0,0 +1,41 @@
+"""
+EXPLAIN QUERY PLAN checks for the hot queries listed in check_query_plans.py.
+
+Each query must be answered from an index: a plain SCAN of a table or a
+temporary B-tree for ORDER BY fails the test.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import app, db, Exercise, Nutrition, TrainingProgram, Article, Media, category_query, latest_query
+from check_query_plans import hot_queries, explain, bad_steps
+
+with app.app_context():
+    QUERIES = hot_queries()
+
+
+@pytest.fixture(scope='module')
+def conn():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    with app.app_context(), engine.connect() as connection:
+        yield connection
+
+
+@pytest.mark.parametrize('name, query', QUERIES, ids=[name for name, _ in QUERIES])
+def test_query_uses_an_index(conn, name, query):
+    plan = explain(conn, query)
+    assert not bad_steps(plan), f'{name}: {" | ".join(plan)}'
+
+
+@pytest.mark.parametrize('model', [Exercise, Nutrition, TrainingProgram, Article, Media])
+def test_category_listing_uses_composite_index(conn, model):
+    plan = ' | '.join(explain(conn, category_query(model, 'beginners')))
+    assert f'ix_{model.__tablename__}_category_created_at' in plan, plan
+
+
+@pytest.mark.parametrize('model', [Exercise, Nutrition, TrainingProgram, Article, Media])
+def test_latest_listing_uses_created_at_index(conn, model):
+    plan = ' | '.join(explain(conn, latest_query(model).limit(3)))
+    assert f'ix_{model.__tablename__}_created_at' in plan, plan